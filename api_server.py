@@ -0,0 +1,294 @@
+"""
+Lightweight asyncio HTTP/JSON API around the chatbot engine.
+
+    python api_server.py --port 8000
+
+    GET  /health                      → { "status": "ok", "engine": Engine.stats() }
+    GET  /stats                       → StorageBackend.stats()
+    POST /chat        { "message", "session_id"? }
+                                      → { "response", "intent", "confidence", "session_id" }
+    POST /chat/batch  { "messages": [...], "session_id"?, "log"? }
+                                      → { "results": [ { "response", "intent", "confidence" }, ... ] }
+
+HTTP/1.1 keep-alive and `Expect: 100-continue` are supported; request
+bodies need Content-Length (chunked ones get 501). Classification and
+log writes run in an executor so the event loop only parses requests
+and writes responses. Turns are logged to the CHATBOT_STORAGE backend; SQLite
+always goes through database's write-behind LogWriter here.
+With --processes N, scoring runs in a worker_pool.ClassifierPool so
+throughput scales past one core.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import uuid
+from concurrent.futures import Executor, ThreadPoolExecutor
+from http import HTTPStatus
+
+import chatbot_engine
+import storage
+from worker_pool import ClassifierPool
+
+MAX_BODY_BYTES = 1 << 20        # 1 MiB
+MAX_BATCH_SIZE = 10000
+KEEPALIVE_TIMEOUT = 15          # seconds a connection may sit idle
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str | None = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+# ─────────────────────────────────────────────
+#  HANDLERS  — the blocking parts run in the executor
+# ─────────────────────────────────────────────
+def open_store() -> storage.StorageBackend:
+    """Open the CHATBOT_STORAGE backend. SQLite always writes behind here
+    so executor threads never wait on a commit."""
+    options = {"write_behind": True} if storage.STORAGE_BACKEND == "sqlite" else {}
+    store = storage.create_backend(**options)
+    store.open()
+    return store
+
+
+def chat_turn(store: storage.StorageBackend, session_id: str,
+              message: str) -> dict:
+    """Same path as the Streamlit chat handler: log user → reply → log bot."""
+    store.log(session_id, "user", message)
+    result = chatbot_engine.get_response(message)
+    store.log(session_id, "bot", result["response"],
+              result["intent"], result["confidence"])
+    return {**result, "session_id": session_id}
+
+
+def log_turn(store: storage.StorageBackend, session_id: str, message: str,
+             result: dict) -> dict:
+    """Log a turn whose reply was computed elsewhere (the process pool)."""
+    store.log(session_id, "user", message)
+    store.log(session_id, "bot", result["response"],
+              result["intent"], result["confidence"])
+    return {**result, "session_id": session_id}
+
+
+def chat_batch(store: storage.StorageBackend, messages: list[str],
+               session_id: str | None, log: bool,
+               pool: ClassifierPool | None = None) -> dict:
+    if pool is not None:
+        results = pool.get_responses(messages)
+    else:
+        results = chatbot_engine.get_responses(messages)
+    if log:
+        session_id = session_id or uuid.uuid4().hex[:8]
+        for message, result in zip(messages, results):
+            store.log(session_id, "user", message)
+            store.log(session_id, "bot", result["response"],
+                      result["intent"], result["confidence"])
+    return {"results": results}
+
+
+def _require_str(payload: dict, key: str, optional: bool = False) -> str | None:
+    value = payload.get(key)
+    if value is None and optional:
+        return None
+    if not isinstance(value, str):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"'{key}' must be a string")
+    return value
+
+
+class ChatAPI:
+    def __init__(self, executor: Executor | None = None,
+                 pool: ClassifierPool | None = None,
+                 store: storage.StorageBackend | None = None):
+        self.executor = executor or ThreadPoolExecutor(
+            thread_name_prefix="chat-api")
+        self.pool = pool
+        self.store = store or storage.get_backend()
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def dispatch(self, method: str, path: str, body: bytes) -> dict:
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return {"status": "ok", "engine": chatbot_engine.get_engine().stats()}
+        if path == "/stats":
+            if method != "GET":
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            return await self._run(self.store.stats)
+        if path not in ("/chat", "/chat/batch"):
+            raise HTTPError(HTTPStatus.NOT_FOUND)
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be JSON")
+        if not isinstance(payload, dict):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+        session_id = _require_str(payload, "session_id", optional=True)
+
+        if path == "/chat":
+            message = _require_str(payload, "message")
+            session_id = session_id or uuid.uuid4().hex[:8]
+            if self.pool is None:
+                return await self._run(chat_turn, self.store, session_id,
+                                       message)
+            result = await self.pool.classify_async(message)
+            return await self._run(
+                log_turn, self.store, session_id, message,
+                chatbot_engine.respond(result))
+
+        messages = payload.get("messages")
+        if (not isinstance(messages, list)
+                or not all(isinstance(m, str) for m in messages)):
+            raise HTTPError(HTTPStatus.BAD_REQUEST,
+                            "'messages' must be a list of strings")
+        if len(messages) > MAX_BATCH_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                            f"at most {MAX_BATCH_SIZE} messages per batch")
+        return await self._run(
+            chat_batch, self.store, messages, session_id,
+            bool(payload.get("log", False)), self.pool)
+
+    # ── HTTP/1.1 plumbing ──
+    async def handle_connection(self, reader: asyncio.StreamReader,
+                                writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        asyncio.LimitOverrunError, ConnectionError):
+                    return
+                keep_alive = await self._handle_request(head, reader, writer)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def _handle_request(self, head: bytes, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> bool:
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ", 2)
+        except ValueError:
+            await self._send(writer, HTTPStatus.BAD_REQUEST,
+                             {"error": "malformed request line"}, False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        keep_alive = (connection != "close" if version == "HTTP/1.1"
+                      else connection == "keep-alive")
+
+        if "transfer-encoding" in headers:
+            # Chunked bodies are not parsed; reading on would treat the
+            # chunks as the next request, so refuse and close
+            await self._send(writer, HTTPStatus.NOT_IMPLEMENTED,
+                             {"error": "Transfer-Encoding is not supported; "
+                                       "send Content-Length"}, False)
+            return False
+        expect = headers.get("expect", "").lower()
+        if expect and expect != "100-continue":
+            await self._send(writer, HTTPStatus.EXPECTATION_FAILED,
+                             {"error": f"unsupported Expect: {expect}"}, False)
+            return False
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            length = -1
+        if not 0 <= length <= MAX_BODY_BYTES:
+            # An unread body would desync the connection, so close it
+            await self._send(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                             if length > 0 else HTTPStatus.BAD_REQUEST,
+                             {"error": "bad Content-Length"}, False)
+            return False
+        if expect and length:
+            writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await writer.drain()
+        try:
+            body = await reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            return False
+
+        status = HTTPStatus.OK
+        try:
+            payload = await self.dispatch(method, target.split("?", 1)[0], body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": str(e)}
+        except Exception:
+            logger.exception("Error handling %s %s", method, target)
+            status, payload = (HTTPStatus.INTERNAL_SERVER_ERROR,
+                               {"error": "internal error"})
+
+        await self._send(writer, status, payload, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    async def _send(writer: asyncio.StreamWriter, status: HTTPStatus,
+                    payload: dict, keep_alive: bool):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n".encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 8000,
+                executor: Executor | None = None,
+                pool: ClassifierPool | None = None):
+    store = open_store()
+    chatbot_engine.get_engine().warm_up()   # NLTK, WordNet, KB before traffic
+    if pool is not None:
+        pool.warm()
+    api = ChatAPI(executor, pool, store)
+    server = await asyncio.start_server(api.handle_connection, host, port)
+    logger.info("Serving on http://%s:%d", host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        store.close()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="SupportBot HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="executor threads for scoring and logging")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="score in N worker processes (0 = in-process)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    executor = ThreadPoolExecutor(args.threads, thread_name_prefix="chat-api")
+    pool = ClassifierPool(args.processes) if args.processes else None
+    try:
+        asyncio.run(serve(args.host, args.port, executor, pool))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,13 @@
 import streamlit as st
+import os
+import tempfile
+import time
 import uuid
 import pandas as pd
 from datetime import datetime
-from chatbot_engine import get_response, KNOWLEDGE_BASE
-from database import (
-    init_db, log_message, fetch_all_logs,
-    fetch_intent_stats, fetch_total_stats, clear_all_logs
-)
+import metrics
+from chatbot_engine import Engine, get_engine, knowledge_base, cache_stats
+import storage
 
 # ──────────────────────────────────────────────
 #  PAGE CONFIG
@@ -198,8 +199,8 @@ html, body, [class*="css"] {
     font-weight: 600 !important;
 }
 
-/* ── Tabs ─────────────────────────────────*/
-.stTabs [data-baseweb="tab"] {
+/* ── View switcher ───────────────────────*/
+.stRadio [role="radiogroup"] label {
     font-family: 'Syne', sans-serif !important;
     font-weight: 600;
 }
@@ -220,14 +221,149 @@ hr { border-color: var(--border) !important; margin: 1rem 0; }
 # ──────────────────────────────────────────────
 #  INIT
 # ──────────────────────────────────────────────
-init_db()
+@st.cache_resource(show_spinner=False)
+def load_store() -> storage.StorageBackend:
+    """The conversation log backend (CHATBOT_STORAGE), opened once per
+    server process and shared by every session."""
+    return storage.get_backend()
+
+
+store = load_store()
+
+
+@st.cache_resource(show_spinner=False)
+def load_engine() -> Engine:
+    """One engine per server process, shared by every session. Warming
+    starts on the first script run, so NLTK and WordNet are loaded before
+    anyone sends a message rather than during their first reply."""
+    engine = get_engine()
+    engine.warm_up_in_background()
+    return engine
+
+
+engine = load_engine()
+
+VIEW_CHAT, VIEW_DASHBOARD, VIEW_LOGS = VIEWS = ["💬 Chat", "📊 Analytics", "📋 Logs"]
+
+# Chat history: only the last CHAT_WINDOW messages are drawn and "Load
+# earlier" widens the window by CHAT_PAGE. At most MAX_HISTORY messages
+# are kept in memory per session; older ones are paged back from the log
+# store on demand into a separate buffer of at most MAX_EARLIER.
+CHAT_WINDOW = 20
+CHAT_PAGE = 20
+MAX_HISTORY = 200
+MAX_EARLIER = 200
+
+# Rows per export from the Logs view. The file is held in server memory
+# until downloaded, so full history goes through `python -m database export`.
+UI_EXPORT_MAX_ROWS = 50_000
 
 if "session_id" not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())[:8]
 if "messages" not in st.session_state:
     st.session_state.messages = []
+    st.session_state.message_count = 0      # whole session, not just memory
+    st.session_state.chat_window = CHAT_WINDOW
+    st.session_state.history_in_db = False  # older messages trimmed to DB
+if "earlier" not in st.session_state:
+    st.session_state.earlier = []           # paged back from the log store
 if "show_badges" not in st.session_state:
     st.session_state.show_badges = True
+if "view" not in st.session_state:
+    st.session_state.view = VIEW_CHAT
+
+
+# ──────────────────────────────────────────────
+#  CACHED READS — shared by all sessions
+# ──────────────────────────────────────────────
+# Dashboard queries are keyed on store.generation(), which
+# changes on every write from this process, so new messages show up on
+# the next rerun while idle reruns (toggles, navigation) hit the cache.
+# The TTL bounds staleness from writers in other processes.
+DASHBOARD_TTL = 10
+
+
+@st.cache_data(ttl=DASHBOARD_TTL, max_entries=8, show_spinner=False)
+def cached_total_stats(generation: int) -> dict:
+    return store.stats()
+
+
+@st.cache_data(ttl=DASHBOARD_TTL, max_entries=8, show_spinner=False)
+def cached_intent_stats(generation: int) -> list[dict]:
+    return store.intent_stats()
+
+
+@st.cache_data(ttl=DASHBOARD_TTL, max_entries=64, show_spinner=False)
+def cached_logs_page(generation: int, after_id: int | None, limit: int,
+                     session_id: str | None, role: str | None,
+                     intent: str | None, since: str | None) -> list[dict]:
+    return store.fetch(after_id, limit, session_id=session_id,
+                       role=role, intent=intent, since=since)
+
+
+def append_message(msg: dict):
+    """Add a chat message, trimming the oldest beyond MAX_HISTORY."""
+    messages = st.session_state.messages
+    messages.append(msg)
+    st.session_state.message_count += 1
+    if len(messages) > MAX_HISTORY:
+        trimmed = messages[:len(messages) - MAX_HISTORY]
+        del messages[:len(trimmed)]
+        st.session_state.history_in_db = True
+        earlier = st.session_state.earlier
+        if earlier:
+            # Keep paged-back history contiguous with the live messages
+            earlier.extend(trimmed)
+            del earlier[:max(0, len(earlier) - MAX_EARLIER)]
+
+
+def chat_history() -> list[dict]:
+    """Paged-back turns followed by the in-memory ones, oldest first."""
+    return st.session_state.earlier + st.session_state.messages
+
+
+def can_load_earlier() -> bool:
+    """True if "Load earlier" has something to show: hidden messages, or
+    older turns in the log store and room in the earlier buffer."""
+    return (len(chat_history()) > st.session_state.chat_window
+            or (st.session_state.history_in_db
+                and len(st.session_state.earlier) < MAX_EARLIER))
+
+
+def load_earlier():
+    """Widen the chat window, paging older turns from the log store if needed."""
+    earlier = st.session_state.earlier
+    history = chat_history()
+    st.session_state.chat_window = min(
+        st.session_state.chat_window + CHAT_PAGE, MAX_HISTORY + MAX_EARLIER)
+    missing = min(st.session_state.chat_window - len(history),
+                  MAX_EARLIER - len(earlier))
+    if missing <= 0 or not st.session_state.history_in_db:
+        return
+    store.flush()
+    session_id = st.session_state.session_id
+    if history and "id" in history[0]:
+        rows = store.fetch(history[0]["id"], missing, session_id=session_id)
+    else:
+        # Live messages carry no row id: skip past the ones in memory
+        rows = store.fetch(None, len(history) + missing,
+                           session_id=session_id)[len(history):]
+    older = [{"id": r["id"], "role": r["role"], "content": r["message"],
+              "intent": r["intent"], "confidence": r["confidence"]}
+             for r in reversed(rows)]
+    earlier[:0] = older
+    if len(older) < missing:
+        st.session_state.history_in_db = False
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def kb_coverage(version: str) -> pd.DataFrame:
+    return pd.DataFrame([
+        {"Intent": intent.title(),
+         "Patterns": len(data["patterns"]),
+         "Responses": len(data["responses"])}
+        for intent, data in knowledge_base().items()
+    ])
 
 # ──────────────────────────────────────────────
 #  SIDEBAR
@@ -255,7 +391,7 @@ with st.sidebar:
     <br><code style='color:#4f8cff; background: rgba(79,140,255,0.1);
     padding:2px 8px; border-radius:4px;'>#{st.session_state.session_id}</code>
     """, unsafe_allow_html=True)
-    st.caption(f"Messages this session: **{len(st.session_state.messages)}**")
+    st.caption(f"Messages this session: **{st.session_state.message_count}**")
 
     st.markdown("<hr>", unsafe_allow_html=True)
     st.markdown("**💡 Quick Topics**")
@@ -270,24 +406,31 @@ with st.sidebar:
     for label, prompt in topics.items():
         if st.button(label, use_container_width=True, key=f"quick_{label}"):
             st.session_state["prefill"] = prompt
+            st.session_state.view = VIEW_CHAT
             st.rerun()
 
     st.markdown("<hr>", unsafe_allow_html=True)
     if st.button("🗑️ Clear Chat", use_container_width=True):
         st.session_state.messages = []
+        st.session_state.earlier = []
+        st.session_state.message_count = 0
+        st.session_state.chat_window = CHAT_WINDOW
+        st.session_state.history_in_db = False
         st.session_state.session_id = str(uuid.uuid4())[:8]
         st.rerun()
 
 # ──────────────────────────────────────────────
-#  MAIN LAYOUT — Tabs
+#  MAIN LAYOUT — Views
 # ──────────────────────────────────────────────
-tab_chat, tab_dashboard, tab_logs = st.tabs(
-    ["💬 Chat", "📊 Analytics", "📋 Logs"])
+# st.tabs runs every tab's body on each rerun; a radio switcher only
+# runs the visible one, keeping dashboard queries off the chat path.
+st.radio("View", VIEWS, key="view", horizontal=True,
+         label_visibility="collapsed")
 
 # ════════════════════════════════════════════════
 #  TAB 1 — CHAT
 # ════════════════════════════════════════════════
-with tab_chat:
+if st.session_state.view == VIEW_CHAT:
     # Hero header
     st.markdown("""
     <div class="hero-header">
@@ -313,8 +456,14 @@ with tab_chat:
         </div>
         """, unsafe_allow_html=True)
 
-    # Render message history
-    for msg in st.session_state.messages:
+    # Render the last chat_window messages
+    if can_load_earlier():
+        st.button("⬆️ Load earlier messages", on_click=load_earlier,
+                  use_container_width=True)
+    elif st.session_state.history_in_db:
+        st.caption("Older messages are in the 📋 Logs view "
+                   f"(session #{st.session_state.session_id}).")
+    for msg in chat_history()[-st.session_state.chat_window:]:
         if msg["role"] == "user":
             st.markdown(f"""
             <div class="chat-user">
@@ -345,34 +494,38 @@ with tab_chat:
         user_input = prefill_val
 
     if user_input:
+        turn_start = time.perf_counter()
+
         # Save & display user message
-        st.session_state.messages.append(
-            {"role": "user", "content": user_input})
-        log_message(st.session_state.session_id, "user", user_input)
+        append_message({"role": "user", "content": user_input})
+        with metrics.timed("log_user"):
+            store.log(st.session_state.session_id, "user", user_input)
 
         # Get bot response
-        result = get_response(user_input)
+        result = engine.get_response(user_input)
         response_text = result["response"]
         intent = result["intent"]
         confidence = result["confidence"]
 
         # Save & log bot response
-        st.session_state.messages.append({
+        append_message({
             "role": "bot",
             "content": response_text,
             "intent": intent,
             "confidence": confidence,
         })
-        log_message(
-            st.session_state.session_id, "bot",
-            response_text, intent, confidence
-        )
+        with metrics.timed("log_bot"):
+            store.log(
+                st.session_state.session_id, "bot",
+                response_text, intent, confidence
+            )
+        metrics.record("turn", time.perf_counter() - turn_start)
         st.rerun()
 
 # ════════════════════════════════════════════════
 #  TAB 2 — ANALYTICS DASHBOARD
 # ════════════════════════════════════════════════
-with tab_dashboard:
+elif st.session_state.view == VIEW_DASHBOARD:
     st.markdown("""
     <div style='font-family:Syne,sans-serif; font-size:1.5rem; font-weight:800;
                 margin-bottom:1rem; color:#e2e8f0;'>
@@ -380,7 +533,8 @@ with tab_dashboard:
     </div>
     """, unsafe_allow_html=True)
 
-    stats = fetch_total_stats()
+    generation = store.generation()
+    stats = cached_total_stats(generation)
     c1, c2, c3, c4 = st.columns(4)
     with c1:
         st.markdown(f"""
@@ -407,10 +561,39 @@ with tab_dashboard:
             <div class="metric-label">Bot Responses</div>
         </div>""", unsafe_allow_html=True)
 
+    # Per-stage latency (this server process)
+    st.markdown("<br>**⏱️ Reply Latency by Stage**", unsafe_allow_html=True)
+    stage_stats = metrics.snapshot()
+    if stage_stats:
+        df_stages = pd.DataFrame(stage_stats)[
+            ["stage", "count", "p50_ms", "p95_ms", "p99_ms"]]
+        df_stages.columns = ["Stage", "Samples", "p50 (ms)", "p95 (ms)", "p99 (ms)"]
+        st.dataframe(df_stages.round(3), use_container_width=True,
+                     hide_index=True)
+        # Snapshots go to the SQLite stage_metrics table, which the
+        # memory and segment stores never create
+        if store.name == "sqlite" and st.button("💾 Save Latency Snapshot"):
+            metrics.persist()
+            st.success("Snapshot saved to stage_metrics.")
+    else:
+        st.caption("No timings recorded in this server process yet.")
+    result_cache = cache_stats()["result"]
+    st.caption(f"Reply cache: {result_cache['hit_rate']:.0%} hit rate "
+               f"({result_cache['hits']} hits, {result_cache['misses']} misses, "
+               f"{result_cache['size']}/{result_cache['maxsize']} entries)")
+    memory = metrics.process_memory()
+    rss = (f"{memory['rss_mb']:.0f} MB resident, " if memory["rss_mb"] is not None
+           else "")
+    peak = (f"peak {memory['peak_rss_mb']:.0f} MB"
+            if memory["peak_rss_mb"] is not None else "peak unknown")
+    warm = (f"engine warmed in {engine.warmup_seconds:.1f}s" if engine.warm
+            else "engine warming up")
+    st.caption(f"Server process {memory['pid']}: {rss}{peak}; {warm}")
+
     st.markdown("<hr>", unsafe_allow_html=True)
 
     # Intent Distribution Chart
-    intent_data = fetch_intent_stats()
+    intent_data = cached_intent_stats(generation)
     if intent_data:
         st.markdown("**🎯 Intent Distribution**")
         df_intent = pd.DataFrame(intent_data)
@@ -422,20 +605,13 @@ with tab_dashboard:
 
     # Knowledge base coverage
     st.markdown("**📚 Knowledge Base Coverage**")
-    kb_data = []
-    for intent, data in KNOWLEDGE_BASE.items():
-        kb_data.append({
-            "Intent": intent.title(),
-            "Patterns": len(data["patterns"]),
-            "Responses": len(data["responses"]),
-        })
-    df_kb = pd.DataFrame(kb_data)
+    df_kb = kb_coverage(engine.kb.version)
     st.dataframe(df_kb, use_container_width=True, hide_index=True)
 
 # ════════════════════════════════════════════════
 #  TAB 3 — LOGS
 # ════════════════════════════════════════════════
-with tab_logs:
+elif st.session_state.view == VIEW_LOGS:
     st.markdown("""
     <div style='font-family:Syne,sans-serif; font-size:1.5rem; font-weight:800;
                 margin-bottom:1rem; color:#e2e8f0;'>
@@ -445,14 +621,57 @@ with tab_logs:
 
     col1, col2 = st.columns([3, 1])
     with col1:
-        st.caption("All user interactions are logged to SQLite for analysis.")
+        st.caption(f"All user interactions are logged to the {store.name} "
+                   "log store for analysis.")
     with col2:
         if st.button("🗑️ Clear All Logs", type="secondary"):
-            clear_all_logs()
+            store.clear()
             st.success("Logs cleared!")
             st.rerun()
 
-    logs = fetch_all_logs()
+    # ── Filters ──
+    f1, f2, f3, f4 = st.columns(4)
+    with f1:
+        flt_session = st.text_input("Session", placeholder="e.g. 1a2b3c4d")
+    with f2:
+        flt_role = st.selectbox("Role", ["All", "user", "bot"])
+    with f3:
+        flt_intent = st.selectbox(
+            "Intent", ["All", *knowledge_base(), "help", "empty", "unknown"])
+    with f4:
+        flt_since = st.date_input("Since", value=None)
+    page_size = st.select_slider(
+        "Rows per page", options=[50, 100, 250, 500], value=100)
+
+    filters = {
+        "session_id": flt_session.strip().lstrip("#") or None,
+        "role": None if flt_role == "All" else flt_role,
+        "intent": None if flt_intent == "All" else flt_intent,
+        "since": flt_since.isoformat() if flt_since else None,
+    }
+    # Keyset cursors: one "after id" per page visited; reset on new filters
+    if st.session_state.get("log_filters") != (filters, page_size):
+        st.session_state.log_filters = (filters, page_size)
+        st.session_state.log_cursors = [None]
+    cursors = st.session_state.log_cursors
+
+    logs = cached_logs_page(store.generation(), cursors[-1], page_size,
+                            **filters)
+
+    n1, n2, n3 = st.columns([1, 2, 1])
+    with n1:
+        if st.button("⬅️ Newer", disabled=len(cursors) == 1,
+                     use_container_width=True):
+            cursors.pop()
+            st.rerun()
+    with n2:
+        st.caption(f"Page {len(cursors)} · {len(logs)} rows")
+    with n3:
+        if st.button("Older ➡️", disabled=len(logs) < page_size,
+                     use_container_width=True):
+            cursors.append(logs[-1]["id"])
+            st.rerun()
+
     if logs:
         df_logs = pd.DataFrame(logs)
         df_logs = df_logs[["timestamp", "session_id",
@@ -472,18 +691,57 @@ with tab_logs:
             height=450,
             hide_index=True,
         )
-
-        # Download
-        csv = df_logs.to_csv(index=False).encode("utf-8")
-        st.download_button(
-            "⬇️ Download Logs as CSV",
-            data=csv,
-            file_name=f"chat_logs_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-            mime="text/csv",
-        )
+    elif len(cursors) > 1 or any(filters.values()):
+        st.info("💡 No logs match these filters.")
     else:
         st.info("💡 No logs yet. Start chatting to generate logs!")
 
+    # ── Export: streamed from the log store in chunks to a temp file, capped ──
+    with st.expander("⬇️ Export Logs"):
+        export_formats = {
+            "CSV": (".csv", "text/csv"),
+            "CSV (gzip)": (".csv.gz", "application/gzip"),
+            "Parquet": (".parquet", "application/octet-stream"),
+        }
+        e1, e2 = st.columns(2)
+        with e1:
+            exp_fmt = st.radio("Format", list(export_formats), horizontal=True)
+        with e2:
+            exp_all = st.checkbox("Full history (ignore filters)")
+        ext, mime = export_formats[exp_fmt]
+        st.caption(f"The newest {UI_EXPORT_MAX_ROWS:,} rows, newest first. "
+                   "For more, run `python -m database export` on the server.")
+
+        if st.button("Prepare Export"):
+            fd, path = tempfile.mkstemp(prefix="chat_logs_", suffix=ext)
+            os.close(fd)
+            try:
+                count = store.export(path, max_rows=UI_EXPORT_MAX_ROWS,
+                                     newest_first=True,
+                                     **({} if exp_all else filters))
+                with open(path, "rb") as fh:
+                    data = fh.read()
+            except ImportError as e:
+                st.error(str(e))
+            else:
+                st.session_state.log_export = (data, ext, mime, count)
+            finally:
+                os.remove(path)
+
+        if "log_export" in st.session_state:
+            data, ext, mime, count = st.session_state.log_export
+            if count >= UI_EXPORT_MAX_ROWS:
+                st.warning(f"Export stopped at {UI_EXPORT_MAX_ROWS:,} rows; "
+                           "narrow the filters or use the command line.")
+            # Dropped from the session once downloaded
+            st.download_button(
+                f"⬇️ Download {count} rows",
+                data=data,
+                file_name=f"chat_logs_{datetime.now().strftime('%Y%m%d_%H%M')}{ext}",
+                mime=mime,
+                on_click=lambda: st.session_state.pop("log_export", None),
+            )
+
 # ──────────────────────────────────────────────
 #  Footer
 # ──────────────────────────────────────────────
@@ -0,0 +1,402 @@
+"""
+Benchmark suite for the chatbot engine and the logging layer.
+
+    python benchmarks.py                               # engine + 10k-row DB
+    python benchmarks.py --rows 10000 1000000 10000000 --output bench.json
+    python benchmarks.py --corpus chat_logs.db --baseline old.json
+    python benchmarks.py --rows 100000 --storage sqlite memory segments
+
+Everything runs against a temporary SQLite file; the checked-in
+chat_logs.db is only ever opened read-only, as a recorded corpus.
+Results are written as JSON so runs can be diffed across versions.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import chatbot_engine
+import database
+import storage
+from worker_pool import ClassifierPool
+
+FILLER = ["please", "i", "need", "my", "the", "can", "you", "tell", "me",
+          "about", "quickly", "today", "again", "really", "account", "now"]
+NOISE = ["blorp", "zebra", "quantum", "banana", "weather", "football",
+         "guitar", "volcano", "nebula", "pancake"]
+
+
+# ─────────────────────────────────────────────
+#  CORPORA
+# ─────────────────────────────────────────────
+def synthetic_corpus(n: int, seed: int = 0) -> list[str]:
+    """Messages built from knowledge base patterns, filler and noise,
+    with some help/empty/unknown cases mixed in."""
+    rng = random.Random(seed)
+    patterns = [p for data in chatbot_engine.knowledge_base().values()
+                for p in data["patterns"]]
+    messages = []
+    for _ in range(n):
+        roll = rng.random()
+        if roll < 0.02:
+            messages.append(rng.choice(chatbot_engine.HELP_COMMANDS))
+        elif roll < 0.04:
+            messages.append(rng.choice(["", "   ", "?!", "..."]))
+        elif roll < 0.15:
+            messages.append(" ".join(rng.sample(NOISE, rng.randint(1, 4))))
+        else:
+            words = [rng.choice(patterns)]
+            words += rng.sample(FILLER, rng.randint(0, 6))
+            rng.shuffle(words)
+            messages.append(" ".join(words).capitalize() + rng.choice(["", "?", "!", "."]))
+    return messages
+
+
+def recorded_corpus(path: str) -> list[str]:
+    """User messages from a text file (one per line) or a chat_logs
+    SQLite database, opened read-only."""
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT message FROM conversations WHERE role = 'user' "
+                "ORDER BY id").fetchall()
+        finally:
+            conn.close()
+        return [r[0] for r in rows]
+    with open(path, encoding="utf-8") as fh:
+        return [line.rstrip("\n") for line in fh if line.strip()]
+
+
+# ─────────────────────────────────────────────
+#  TIMING
+# ─────────────────────────────────────────────
+def summarize(latencies: list[float], ops: int | None = None) -> dict:
+    """Latency summary in milliseconds; `ops` is work items per sample."""
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    if not ordered:
+        return {"samples": 0}
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "samples": len(ordered),
+        "mean_ms": total / len(ordered) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "ops_per_sec": (ops or len(ordered)) / total if total else None,
+    }
+
+
+def time_each(fn, inputs) -> list[float]:
+    latencies = []
+    for item in inputs:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def time_repeat(fn, repeat: int) -> list[float]:
+    return time_each(lambda _: fn(), range(repeat))
+
+
+# ─────────────────────────────────────────────
+#  ENGINE BENCHMARKS
+# ─────────────────────────────────────────────
+def bench_engine(corpus: list[str]) -> dict:
+    chatbot_engine.compiled_kb()    # load NLTK data + compile outside timings
+    results = {"messages": len(corpus)}
+
+    chatbot_engine.clear_caches()
+    results["preprocess_cold"] = summarize(
+        time_each(chatbot_engine.preprocess, corpus))
+    results["preprocess_warm"] = summarize(
+        time_each(chatbot_engine.preprocess, corpus))
+    results["preprocess_cache"] = chatbot_engine.cache_stats()
+
+    tokenized = [chatbot_engine.preprocess(m) for m in corpus]
+    results["match_intent"] = summarize(
+        time_each(chatbot_engine.match_intent, tokenized))
+    results["get_response"] = summarize(
+        time_each(chatbot_engine.get_response, corpus))
+
+    chatbot_engine.get_responses(corpus[:10])     # import NumPy, build matrix
+    start = time.perf_counter()
+    chatbot_engine.get_responses(corpus)
+    elapsed = time.perf_counter() - start
+    results["get_responses_batch"] = summarize([elapsed], ops=len(corpus))
+    return results
+
+
+def synthetic_kb(intents: int, seed: int = 0) -> chatbot_engine.CompiledKB:
+    """A catalog-sized knowledge base: each intent gets a few rare product
+    words plus one generic word ("order", "support", ...) per pattern."""
+    rng = random.Random(seed)
+    words = [f"item{i}" for i in range(intents * 4)]
+    kb = {
+        f"intent{i}": {
+            "patterns": [" ".join(rng.sample(words, 3) + [rng.choice(FILLER)])
+                         for _ in range(5)],
+            "responses": ["synthetic"],
+        }
+        for i in range(intents)
+    }
+    return chatbot_engine.CompiledKB(
+        {"intents": kb, "fallback_responses": ["?"], "help_text": ""},
+        f"synthetic-{intents}")
+
+
+def bench_scoring(intents: int, messages: int) -> dict:
+    """rank_intents() latency per scoring engine on a synthetic catalog."""
+    kb = synthetic_kb(intents)
+    vocab = list(kb.index)
+    rng = random.Random(1)
+    tokenized = [rng.sample(vocab, 4) + rng.sample(FILLER, 2)
+                 for _ in range(messages)]
+    results = {"intents": intents}
+    for scoring in chatbot_engine.SCORING_ENGINES:
+        chatbot_engine.rank_intents(tokenized[0], 5, kb, scoring)  # build weights
+        results[scoring] = summarize(time_each(
+            lambda tokens: chatbot_engine.rank_intents(tokens, 5, kb, scoring),
+            tokenized))
+    return results
+
+
+def bench_pool(corpus: list[str], processes: int) -> dict:
+    """get_responses() throughput through a ClassifierPool."""
+    with ClassifierPool(processes) as pool:
+        pool.warm()
+        start = time.perf_counter()
+        pool.get_responses(corpus)
+        elapsed = time.perf_counter() - start
+    return summarize([elapsed], ops=len(corpus))
+
+
+# ─────────────────────────────────────────────
+#  DATABASE BENCHMARKS
+# ─────────────────────────────────────────────
+def synthetic_turns(rows: int, seed: int = 0):
+    """Yield `rows` (session_id, role, message, intent, confidence) log
+    records, alternating user and bot."""
+    rng = random.Random(seed)
+    intents = [*chatbot_engine.knowledge_base(), "help", "unknown"]
+    sessions = max(1, rows // 20)
+    for i in range(rows):
+        session = f"s{rng.randrange(sessions):07d}"
+        if i % 2 == 0:
+            yield session, "user", "synthetic message", None, None
+        else:
+            yield session, "bot", "synthetic reply", rng.choice(intents), "high"
+
+
+def populate(rows: int, seed: int = 0, chunk: int = 50000):
+    """Bulk-load `rows` synthetic conversation rows (two per turn)."""
+    start = datetime(2024, 1, 1)
+    turns = synthetic_turns(rows, seed)
+    written = 0
+    with database.connect() as conn:
+        while written < rows:
+            batch = []
+            for i in range(written, min(rows, written + chunk)):
+                ts = (start + timedelta(seconds=i * 3)).strftime("%Y-%m-%d %H:%M:%S")
+                session, role, message, intent, confidence = next(turns)
+                batch.append((session, ts, role, message, intent, confidence))
+            with conn:
+                database._insert_records(conn, batch)
+            written += len(batch)
+
+
+def bench_database(rows: int, log_calls: int, repeat: int) -> dict:
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    try:
+        database.configure(db_path=os.path.join(workdir, "bench.db"))
+        database.init_db()
+
+        start = time.perf_counter()
+        populate(rows)
+        results = {"rows": rows, "populate_sec": time.perf_counter() - start}
+
+        results["log_message"] = summarize(time_each(
+            lambda i: database.log_message(f"bench{i % 50}", "user", "hello"),
+            range(log_calls)))
+
+        database.start_log_writer()
+        start = time.perf_counter()
+        for i in range(log_calls):
+            database.log_message(f"bench{i % 50}", "user", "hello")
+        database.flush_logs()
+        results["log_message_write_behind"] = summarize(
+            [time.perf_counter() - start], ops=log_calls)
+        database.stop_log_writer()
+
+        for name in ("fetch_total_stats", "fetch_intent_stats", "fetch_all_logs"):
+            results[name] = summarize(time_repeat(getattr(database, name), repeat))
+        results["db_size_mb"] = os.path.getsize(database.DB_PATH) / 1e6
+        return results
+    finally:
+        database.stop_log_writer()
+        database.close_connections()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_storage(name: str, rows: int, log_calls: int, repeat: int) -> dict:
+    """Time one storage backend through the StorageBackend interface the
+    app uses, with `rows` rows already logged."""
+    workdir = tempfile.mkdtemp(prefix="chatbot-bench-")
+    if name == "sqlite":
+        store = storage.SQLiteBackend(os.path.join(workdir, "bench.db"),
+                                      write_behind=False, retention_days=0)
+    elif name == "segments":
+        store = storage.SegmentLogBackend(os.path.join(workdir, "segments"))
+    else:
+        store = storage.create_backend(name)
+    try:
+        store.open()
+        start = time.perf_counter()
+        if name == "sqlite":
+            populate(rows)
+        else:
+            for turn in synthetic_turns(rows):
+                store.log(*turn)
+        results = {"backend": name, "rows": rows,
+                   "populate_sec": time.perf_counter() - start}
+
+        results["log"] = summarize(time_each(
+            lambda i: store.log(f"bench{i % 50}", "user", "hello"),
+            range(log_calls)))
+        store.flush()
+        results["stats"] = summarize(time_repeat(store.stats, repeat))
+        results["intent_stats"] = summarize(time_repeat(store.intent_stats, repeat))
+        results["fetch_page"] = summarize(time_repeat(
+            lambda: store.fetch(None, 100), repeat))
+        results["fetch_filtered"] = summarize(time_repeat(
+            lambda: store.fetch(None, 100, role="bot", intent="refund"), repeat))
+        export_path = os.path.join(workdir, "export.csv")
+        results["export_newest_10k"] = summarize(time_repeat(
+            lambda: store.export(export_path, max_rows=10000, newest_first=True),
+            min(repeat, 5)))
+        return results
+    finally:
+        store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# ─────────────────────────────────────────────
+#  REPORTING
+# ─────────────────────────────────────────────
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _p50s(results: dict, prefix: str = "") -> dict[str, float]:
+    """Flatten every p50_ms in a results tree to { "path": value }."""
+    found = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if "p50_ms" in value:
+                found[prefix + key] = value["p50_ms"]
+            else:
+                found.update(_p50s(value, f"{prefix}{key}."))
+    return found
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Return the benchmarks whose p50 grew by more than `tolerance`."""
+    old, new = _p50s(baseline), _p50s(current)
+    regressions = []
+    for name in sorted(old.keys() & new.keys()):
+        if old[name] > 0 and new[name] > old[name] * (1 + tolerance):
+            regressions.append(
+                f"{name}: {old[name]:.3f} ms -> {new[name]:.3f} ms")
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=5000,
+                        help="synthetic corpus size")
+    parser.add_argument("--corpus", help="recorded corpus (.txt or .db)")
+    parser.add_argument("--rows", type=int, nargs="*", default=[10000],
+                        help="conversation table sizes to benchmark")
+    parser.add_argument("--intents", type=int, nargs="*", default=[],
+                        help="time each scoring engine on synthetic KBs this large")
+    parser.add_argument("--processes", type=int, nargs="*", default=[],
+                        help="also time the ClassifierPool at these sizes")
+    parser.add_argument("--storage", nargs="*", default=[],
+                        choices=list(storage.BACKENDS),
+                        help="also time these storage backends at each --rows size")
+    parser.add_argument("--log-calls", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", help="write JSON results here")
+    parser.add_argument("--baseline", help="previous JSON results to compare")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown vs baseline (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "engine": {},
+        "database": {},
+        "storage": {},
+    }
+    corpus = synthetic_corpus(args.messages)
+    results["engine"]["synthetic"] = bench_engine(corpus)
+    for intents in args.intents:
+        results["engine"][f"scoring_{intents}"] = bench_scoring(
+            intents, min(args.messages, 2000))
+    for processes in args.processes:
+        results["engine"][f"pool_{processes}"] = bench_pool(corpus, processes)
+    if args.corpus:
+        recorded = recorded_corpus(args.corpus)
+        if recorded:
+            results["engine"]["recorded"] = bench_engine(recorded)
+        else:
+            print(f"No user messages in {args.corpus}; skipping", file=sys.stderr)
+    for rows in args.rows:
+        results["database"][str(rows)] = bench_database(
+            rows, args.log_calls, args.repeat)
+        for name in args.storage:
+            results["storage"][f"{name}_{rows}"] = bench_storage(
+                name, rows, args.log_calls, args.repeat)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(report)
+    else:
+        print(report)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(results, json.load(fh), args.tolerance)
+        for line in regressions:
+            print("REGRESSION " + line, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
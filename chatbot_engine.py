@@ -1,188 +1,1146 @@
-import nltk
+import os
 import string
 import random
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.stem import WordNetLemmatizer
+import sys
+import threading
+import time
+import hashlib
+import heapq
+import json
+import logging
+import math
+import re
+from collections import OrderedDict
+from functools import lru_cache
 
-# Download required NLTK data
+import metrics
 
+logger = logging.getLogger(__name__)
 
-def download_nltk_data():
-    packages = ['punkt', 'stopwords', 'wordnet',
-                'averaged_perceptron_tagger', 'punkt_tab']
-    for pkg in packages:
+# ─────────────────────────────────────────────
+#  NLTK RESOURCES  — loaded lazily, never at import
+# ─────────────────────────────────────────────
+# Download name → path checked with nltk.data.find(). Which punkt flavour
+# the tokenizer needs depends on the NLTK version (>= 3.8.2 loads only
+# punkt_tab), so missing_nltk_data() asks word_tokenize() instead.
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+    "stopwords": "corpora/stopwords",
+    "wordnet": "corpora/wordnet",
+}
+TOKENIZER_PACKAGES = ("punkt", "punkt_tab")
+
+# Set CHATBOT_NLTK_OFFLINE=1 to never call nltk.download(); missing data
+# then raises LookupError instead (prefetch with `--warmup`).
+NLTK_OFFLINE = os.environ.get("CHATBOT_NLTK_OFFLINE", "0") == "1"
+
+# Fresh-process `import chatbot_engine` must stay under this (see --check-import)
+IMPORT_TIME_BUDGET_MS = 100
+
+
+def missing_nltk_data() -> list[str]:
+    """Return the NLTK packages not installed locally (no network)."""
+    import nltk
+
+    missing = []
+    for pkg, path in NLTK_RESOURCES.items():
+        if pkg in TOKENIZER_PACKAGES:
+            continue
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(pkg)
+    tokenizer = _missing_tokenizer_data()
+    if tokenizer is not None:
+        missing.insert(0, tokenizer)
+    return missing
+
+
+def _missing_tokenizer_data() -> str | None:
+    """The punkt package the installed word_tokenize() fails to load, if any."""
+    from nltk.tokenize import word_tokenize
+
+    try:
+        word_tokenize("x")
+    except LookupError as e:
+        return "punkt_tab" if "punkt_tab" in str(e) else "punkt"
+    return None
+
+
+def download_nltk_data(packages: list[str] | None = None):
+    import nltk
+
+    for pkg in packages if packages is not None else NLTK_RESOURCES:
         try:
             nltk.download(pkg, quiet=True)
         except Exception:
             pass
 
 
-download_nltk_data()
+_nltk_lock = threading.Lock()
+_nltk = None
 
-lemmatizer = WordNetLemmatizer()
 
-# ─────────────────────────────────────────────
-#  KNOWLEDGE BASE  — FAQ / Customer Support
-# ─────────────────────────────────────────────
-KNOWLEDGE_BASE = {
-    "greetings": {
-        "patterns": ["hello", "hi", "hey", "good morning", "good afternoon",
-                     "good evening", "howdy", "greetings", "sup", "what's up"],
-        "responses": [
-            "Hey there! 👋 How can I help you today?",
-            "Hello! Welcome! What can I do for you?",
-            "Hi! Great to see you. What brings you here today?",
-        ]
-    },
-    "farewell": {
-        "patterns": ["bye", "goodbye", "see you", "take care", "later",
-                     "quit", "exit", "cya", "farewell", "see ya"],
-        "responses": [
-            "Goodbye! Have a wonderful day! 😊",
-            "Take care! Don't hesitate to come back if you need help.",
-            "See you later! Hope I was helpful!",
-        ]
-    },
-    "thanks": {
-        "patterns": ["thank", "thanks", "thank you", "appreciate", "helpful",
-                     "great help", "awesome", "perfect", "wonderful"],
-        "responses": [
-            "You're welcome! 😊 Anything else I can help with?",
-            "Happy to help! Let me know if you need anything else.",
-            "Glad I could assist! Is there anything more you need?",
-        ]
-    },
-    "hours": {
-        "patterns": ["hours", "open", "opening", "closing", "when", "time",
-                     "schedule", "available", "working hours", "business hours"],
-        "responses": [
-            "🕐 We're available **24/7** through this chat! For phone support, our hours are **Mon–Fri, 9 AM – 6 PM IST**.",
-            "Our support team works **Monday to Friday, 9:00 AM – 6:00 PM IST**. But I'm here around the clock! 🌙",
-        ]
-    },
-    "pricing": {
-        "patterns": ["price", "pricing", "cost", "how much", "fee", "charge",
-                     "plan", "subscription", "payment", "pay", "rate", "affordable"],
-        "responses": [
-            "💰 We offer three plans:\n\n• **Starter** — ₹999/mo (1 user)\n• **Pro** — ₹2,499/mo (5 users)\n• **Enterprise** — Custom pricing\n\nAll plans include a **14-day free trial**!",
-            "Our pricing starts at just ₹999/month. Visit our pricing page or type 'plans' for a full breakdown!",
-        ]
-    },
-    "refund": {
-        "patterns": ["refund", "money back", "cancel", "cancellation", "return",
-                     "dispute", "chargeback", "reimbursement"],
-        "responses": [
-            "💸 We offer a **30-day money-back guarantee** — no questions asked. To initiate a refund, email us at **refunds@support.com** or raise a ticket.",
-            "Our refund policy: full refund within 30 days of purchase. Just contact our billing team at **billing@support.com**.",
-        ]
-    },
-    "shipping": {
-        "patterns": ["shipping", "delivery", "ship", "track", "order", "dispatch",
-                     "arrive", "expected", "courier", "package", "parcel"],
-        "responses": [
-            "📦 Standard delivery: **3–5 business days**. Express: **1–2 days** (extra charge). You can track your order with the tracking ID sent to your email!",
-            "Shipping timelines:\n• Standard — 3–5 days\n• Express — 1–2 days\n• International — 7–14 days\n\nNeed help tracking? Share your order ID!",
-        ]
-    },
-    "password": {
-        "patterns": ["password", "forgot", "reset", "login", "sign in",
-                     "account access", "locked out", "otp", "credentials"],
-        "responses": [
-            "🔐 To reset your password:\n1. Click **'Forgot Password'** on the login page\n2. Enter your registered email\n3. Check your inbox for a reset link\n\nDidn't receive the email? Check your spam folder!",
-            "Password reset is easy! Go to **Settings → Security → Reset Password**, or use the 'Forgot Password' link on the login screen.",
-        ]
-    },
-    "contact": {
-        "patterns": ["contact", "reach", "email", "phone", "call", "support",
-                     "human", "agent", "representative", "talk to someone"],
-        "responses": [
-            "📞 You can reach us at:\n\n• **Email:** support@company.com\n• **Phone:** +91-800-123-4567\n• **Live Chat:** Available Mon–Fri, 9 AM–6 PM IST\n\nWant me to raise a support ticket for you?",
-            "Need to talk to a human? No problem! Call **+91-800-123-4567** or email **support@company.com**. Average response time is under 2 hours!",
-        ]
-    },
-    "features": {
-        "patterns": ["feature", "what can", "capability", "do you offer",
-                     "functionality", "option", "service", "product"],
-        "responses": [
-            "🚀 Here's what we offer:\n\n• ✅ Real-time analytics\n• ✅ Automated reports\n• ✅ Team collaboration tools\n• ✅ API integrations\n• ✅ 24/7 AI chat support\n\nWant details on any specific feature?",
-            "Our platform includes analytics, reporting, collaboration, integrations, and much more! Which feature are you most interested in?",
-        ]
-    },
-    "bug": {
-        "patterns": ["bug", "error", "broken", "not working", "issue", "problem",
-                     "crash", "glitch", "fail", "stuck", "slow", "down"],
-        "responses": [
-            "😟 Sorry to hear that! Let's fix it:\n\n1. Try **refreshing** the page\n2. **Clear cache** and cookies\n3. Try a **different browser**\n\nIf the issue persists, please describe the error and I'll escalate it to our tech team!",
-            "That sounds frustrating! Please share:\n• What were you doing when it happened?\n• Any error message?\n• Your browser/device?\n\nThis helps us resolve it faster! 🔧",
-        ]
-    },
-    "about": {
-        "patterns": ["who are you", "what are you", "about you", "your name",
-                     "introduce", "tell me about", "who made you", "ai bot"],
-        "responses": [
-            "🤖 I'm **SupportBot**, your AI-powered customer support assistant! I'm built with Python & NLTK to help with FAQs, troubleshooting, and general queries. How can I help you today?",
-            "Hi, I'm **SupportBot**! I'm here to answer your questions about our products, pricing, shipping, and more. Ask me anything! 😊",
-        ]
-    },
-}
+def _load_nltk():
+    """
+    Return (word_tokenize, stop_words, lemmatizer), importing NLTK and
+    loading its data on first use. Missing data is downloaded unless
+    NLTK_OFFLINE is set. WordNet and the punkt model load lazily and
+    their loaders are not thread-safe, so both are forced here, under
+    the lock, before the tuple is published.
+    """
+    global _nltk
+    if _nltk is not None:
+        return _nltk
+    with _nltk_lock:
+        if _nltk is None:
+            missing = missing_nltk_data()
+            if missing and not NLTK_OFFLINE:
+                download_nltk_data(missing)
+                missing = missing_nltk_data()
+            if missing:
+                raise LookupError(
+                    f"NLTK data not installed: {', '.join(missing)}. "
+                    "Run `python -m chatbot_engine --warmup` first."
+                )
+
+            from nltk.tokenize import word_tokenize
+            from nltk.corpus import stopwords, wordnet
+            from nltk.stem import WordNetLemmatizer
+
+            wordnet.ensure_loaded()
+            word_tokenize("Loading the tokenizer.")
+            _nltk = (word_tokenize,
+                     frozenset(stopwords.words("english")),
+                     WordNetLemmatizer())
+    return _nltk
+
+
+# Every substring of string.punctuation, so membership is O(1) but still
+# matches the old `t not in string.punctuation` substring test exactly.
+PUNCTUATION = frozenset(
+    string.punctuation[i:j]
+    for i in range(len(string.punctuation))
+    for j in range(i + 1, len(string.punctuation) + 1)
+)
+
+# Cache sizes for the preprocess pipeline (see cache_stats())
+LEMMA_CACHE_SIZE = 8192
+MESSAGE_CACHE_SIZE = 2048
+
+# classify() results cached by normalized message (0 disables); entries
+# expire after RESULT_CACHE_TTL seconds and on every KB reload
+RESULT_CACHE_SIZE = int(os.environ.get("CHATBOT_RESULT_CACHE_SIZE", "4096"))
+RESULT_CACHE_TTL = float(os.environ.get("CHATBOT_RESULT_CACHE_TTL", "300"))
+
+# Messages scored per matrix multiply in classify_batch(), at most
+BATCH_CHUNK_SIZE = 4096
+# Above this many token × intent cells the dense batch matrix would cost
+# more memory than it saves time; classify_batch() scores sparsely instead.
+# Chunks are also shrunk so the message × token hit matrix stays under it.
+MATRIX_MAX_CELLS = 4_000_000
+# From this many intents, single messages are scored over NumPy postings
+# arrays; generic tokens then post to thousands of intents at once
+VECTOR_SCORING_MIN_INTENTS = 500
+
+# How intents are scored against the user's tokens:
+#   overlap — sum of pattern-token counts (the original behaviour)
+#   tfidf   — log-scaled TF × smoothed IDF, L2-normalized per intent
+#   bm25    — Okapi BM25, each intent's patterns treated as one document
+SCORING_ENGINES = ("overlap", "tfidf", "bm25")
+SCORING = os.environ.get("CHATBOT_SCORING", "overlap")
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Multi-word patterns ("talk to someone", "money back") are also matched
+# as whole phrases; a phrase hit adds PHRASE_WEIGHT × the weights of its
+# content words on top of the loose-token score (0 disables phrase
+# matching). Below 1, so one phrase word never outweighs two loose ones.
+PHRASE_WEIGHT = float(os.environ.get("CHATBOT_PHRASE_WEIGHT", "0.5"))
+# Words for phrase matching; unlike preprocess(), stopwords are kept
+PHRASE_WORD_RE = re.compile(r"[\w']+")
+
+# Typo tolerance: tokens missing from the KB vocabulary are corrected to
+# the closest KB token within this many edits (0 disables). Tokens get one
+# edit per FUZZY_MIN_LENGTH characters, so short words are never "fixed"
+# into different words.
+FUZZY_MAX_DISTANCE = int(os.environ.get("CHATBOT_FUZZY_MAX_DISTANCE", "2"))
+FUZZY_MIN_LENGTH = 4
+# SymSpell prefix: deletes are generated on the first N characters only,
+# which bounds the index size for long words
+FUZZY_PREFIX_LENGTH = 7
+# Per-message time spent on corrections; remaining tokens stay as typed
+FUZZY_BUDGET_MS = float(os.environ.get("CHATBOT_FUZZY_BUDGET_MS", "2"))
+# Edit distances computed per lookup. Vocabularies sharing long prefixes
+# (SKUs like "item1234") otherwise yield thousands of candidates per typo;
+# the closest deletion variants are tried first.
+FUZZY_MAX_CANDIDATES = int(os.environ.get("CHATBOT_FUZZY_MAX_CANDIDATES", "64"))
 
 # ─────────────────────────────────────────────
-#  FALLBACK RESPONSES
+#  KNOWLEDGE BASE  — FAQ / Customer Support, loaded from KB_DIR
 # ─────────────────────────────────────────────
-FALLBACK_RESPONSES = [
-    "Hmm, I'm not sure I understood that. Could you rephrase? 🤔",
-    "I don't have an answer for that yet. Try asking about **pricing, shipping, refunds, hours, or bugs**!",
-    "That's outside my expertise! You can reach a human agent at **support@company.com** for complex queries.",
-    "I'm still learning! 🧠 Could you ask that differently, or type **'help'** to see what I can assist with.",
-]
-
-HELP_TEXT = """
-🆘 **Here's what I can help you with:**
-
-| Topic | Example Question |
-|-------|-----------------|
-| 🕐 Hours | "What are your working hours?" |
-| 💰 Pricing | "How much does it cost?" |
-| 💸 Refunds | "How do I get a refund?" |
-| 📦 Shipping | "When will my order arrive?" |
-| 🔐 Password | "I forgot my password" |
-| 📞 Contact | "How do I reach support?" |
-| 🚀 Features | "What features do you offer?" |
-| 🐛 Bug | "Something is not working" |
-| 🤖 About | "Who are you?" |
-"""
-
-
-def preprocess(text: str) -> list[str]:
-    """Tokenize, lowercase, remove punctuation & stopwords, then lemmatize."""
-    stop_words = set(stopwords.words("english"))
-    tokens = word_tokenize(text.lower())
-    tokens = [
-        lemmatizer.lemmatize(t)
-        for t in tokens
-        if t not in string.punctuation and t not in stop_words
-    ]
+# Every *.json / *.yaml file in KB_DIR is merged in file-name order. Each
+# may define "intents" ({ name: { "patterns": [...], "responses": [...] } }),
+# "fallback_responses" (list) and "help_text" (str).
+KB_DIR = os.environ.get(
+    "CHATBOT_KB_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "kb"))
+KB_EXTENSIONS = (".json", ".yaml", ".yml")
+
+# Preprocessed patterns + index, reused while the sources are unchanged.
+# Plain JSON: KB_DIR is edited by the content team, so nothing read from
+# it may be able to run code the way unpickling can.
+KB_SNAPSHOT = os.environ.get(
+    "CHATBOT_KB_SNAPSHOT", os.path.join(KB_DIR, ".compiled.json"))
+# Bump when preprocessing or the compiled layout changes
+SNAPSHOT_FORMAT = 3
+
+# Check KB_DIR for edits at most this often (seconds); 0 disables hot reload
+KB_RELOAD_INTERVAL = float(os.environ.get("CHATBOT_KB_RELOAD_INTERVAL", "2"))
+
+HELP_COMMANDS = ("help", "?", "menu", "commands")
+
+EMPTY_RESPONSE = "Please type a message so I can help you! 😊"
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _lemmatize(token: str) -> str:
+    return _load_nltk()[2].lemmatize(token)
+
+
+@lru_cache(maxsize=LEMMA_CACHE_SIZE)
+def _dictionary_word(token: str) -> bool:
+    """True if WordNet knows the word, i.e. it is not a typo to correct."""
+    _load_nltk()
+    from nltk.corpus import wordnet
+
+    return bool(wordnet.synsets(token))
+
+
+def _tokens(text: str, timed: bool) -> tuple[str, ...]:
+    word_tokenize, stop_words, _ = _load_nltk()
+    start = time.perf_counter()
+    raw = word_tokenize(text)
+    tokenized = time.perf_counter()
+    tokens = tuple(
+        _lemmatize(t)
+        for t in raw
+        if t not in PUNCTUATION and t not in stop_words
+    )
+    if timed:
+        metrics.record("tokenize", tokenized - start)
+        metrics.record("lemmatize", time.perf_counter() - tokenized)
     return tokens
 
 
-def match_intent(user_tokens: list[str]) -> str | None:
-    """Return the best-matching intent key, or None."""
-    best_intent = None
-    best_score = 0
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _preprocess_normalized(text: str) -> tuple[str, ...]:
+    return _tokens(text, timed=True)
+
+
+def preprocess(text: str, timed: bool = True) -> list[str]:
+    """
+    Tokenize, lowercase, remove punctuation & stopwords, then lemmatize.
+    KB compilation passes timed=False, which skips the message cache and
+    the tokenize/lemmatize metrics so those only reflect user messages.
+    """
+    if not timed:
+        return list(_tokens(text.lower(), timed=False))
+    return list(_preprocess_normalized(text.lower()))
+
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _phrase_words_normalized(text: str) -> tuple[str, ...]:
+    return tuple(_lemmatize(w) for w in PHRASE_WORD_RE.findall(text))
+
+
+def phrase_words(text: str) -> list[str]:
+    """Lowercased, lemmatized words with stopwords kept, for phrase matching."""
+    return list(_phrase_words_normalized(text.lower()))
+
+
+class ResultCache:
+    """Thread-safe LRU of classification results with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE,
+                 ttl: float = RESULT_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, result: dict):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self, reset_stats: bool = True):
+        with self._lock:
+            self._entries.clear()
+            if reset_stats:
+                self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_result_cache = ResultCache()
+
 
-    for intent, data in KNOWLEDGE_BASE.items():
-        score = 0
+def cache_stats() -> dict:
+    """Return hit/miss counters for the lemma, dictionary, message, phrase
+    and result caches."""
+    stats = {}
+    for name, fn in (("lemma", _lemmatize), ("dictionary", _dictionary_word),
+                     ("message", _preprocess_normalized),
+                     ("phrase", _phrase_words_normalized)):
+        info = fn.cache_info()
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+        }
+    stats["result"] = _result_cache.stats()
+    return stats
+
+
+def clear_caches():
+    """Empty the preprocess caches and reset their counters."""
+    _lemmatize.cache_clear()
+    _dictionary_word.cache_clear()
+    _preprocess_normalized.cache_clear()
+    _phrase_words_normalized.cache_clear()
+    _result_cache.clear()
+
+
+def build_intent_index(knowledge_base: dict) -> dict[str, dict[str, int]]:
+    """
+    Compile the knowledge base into an inverted index:
+        { lemmatized token: { intent: weight } }
+    where weight is how many times the token appears across that
+    intent's preprocessed patterns.
+    """
+    index: dict[str, dict[str, int]] = {}
+    for intent, data in knowledge_base.items():
         for pattern in data["patterns"]:
-            pattern_tokens = preprocess(pattern)
-            for pt in pattern_tokens:
-                if pt in user_tokens:
-                    score += 1
-        if score > best_score:
-            best_score = score
-            best_intent = intent
+            for pt in preprocess(pattern, timed=False):
+                weights = index.setdefault(pt, {})
+                weights[intent] = weights.get(intent, 0) + 1
+    return index
+
+
+def weight_index(index: dict[str, dict[str, int]],
+                 scoring: str) -> dict[str, dict[str, float]]:
+    """
+    Re-weight an inverted index of raw counts for `scoring`. Weights are
+    precomputed per (token, intent), so scoring a message stays a sum
+    over the postings of its tokens whatever the engine.
+    """
+    if scoring not in SCORING_ENGINES:
+        raise ValueError(f"Unknown scoring engine {scoring!r}; "
+                         f"expected one of {', '.join(SCORING_ENGINES)}")
+    if scoring == "overlap":
+        return index
+
+    lengths: dict[str, int] = {}
+    for weights in index.values():
+        for intent, tf in weights.items():
+            lengths[intent] = lengths.get(intent, 0) + tf
+    n = len(lengths)
+    weighted: dict[str, dict[str, float]] = {}
+
+    if scoring == "tfidf":
+        norms = dict.fromkeys(lengths, 0.0)
+        for token, weights in index.items():
+            idf = math.log((1 + n) / (1 + len(weights))) + 1
+            weighted[token] = {}
+            for intent, tf in weights.items():
+                w = (1 + math.log(tf)) * idf
+                weighted[token][intent] = w
+                norms[intent] += w * w
+        for weights in weighted.values():
+            for intent in weights:
+                weights[intent] /= math.sqrt(norms[intent])
+        return weighted
+
+    avg_length = sum(lengths.values()) / n if n else 0.0
+    for token, weights in index.items():
+        df = len(weights)
+        idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+        weighted[token] = {
+            intent: idf * tf * (BM25_K1 + 1) / (
+                tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[intent] / avg_length))
+            for intent, tf in weights.items()
+        }
+    return weighted
+
+
+def build_phrases(knowledge_base: dict) -> list[tuple[tuple[str, ...], str]]:
+    """Every multi-word pattern as (phrase words, intent), in KB order."""
+    return [
+        (words, intent)
+        for intent, data in knowledge_base.items()
+        for words in map(tuple, map(phrase_words, data["patterns"]))
+        if len(words) > 1
+    ]
+
+
+class PhraseMatcher:
+    """
+    Word-level Aho-Corasick automaton. find() reports every phrase
+    occurring in a word sequence in one pass, whatever the phrase count.
+    """
+
+    def __init__(self, phrases: list[tuple[str, ...]]):
+        self.goto: list[dict[str, int]] = [{}]
+        self.output: list[list[int]] = [[]]
+        for phrase_id, words in enumerate(phrases):
+            state = 0
+            for word in words:
+                nxt = self.goto[state].get(word)
+                if nxt is None:
+                    nxt = self.goto[state][word] = len(self.goto)
+                    self.goto.append({})
+                    self.output.append([])
+                state = nxt
+            self.output[state].append(phrase_id)
+
+        # Breadth-first failure links; each state inherits the outputs
+        # of its failure state so find() never walks the chain
+        self.fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for word, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f and word not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(word, 0)
+                self.output[nxt] = self.output[nxt] + self.output[self.fail[nxt]]
+
+    def find(self, words: list[str]) -> set[int]:
+        """Ids of the phrases occurring in `words`."""
+        goto, fail, output = self.goto, self.fail, self.output
+        found: set[int] = set()
+        state = 0
+        for word in words:
+            while state and word not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(word, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+def phrase_bonuses(phrases: list[tuple[tuple[str, ...], str]],
+                   postings: dict[str, dict[str, float]]) -> list[float]:
+    """
+    Extra score per phrase hit: PHRASE_WEIGHT × the intent's weights for
+    the phrase's content words (those with a posting for the intent), so
+    phrases outrank the same words matched loosely under any scoring
+    engine. Stopwords earn nothing, and phrases that are mostly stopwords
+    ("do you offer", "tell me about") are question frames rather than
+    topics, so they get no bonus at all.
+    """
+    bonuses = []
+    for words, intent in phrases:
+        weights = [postings[word][intent] for word in words
+                   if intent in postings.get(word, ())]
+        if 2 * len(weights) < len(words):
+            bonuses.append(0.0)
+        else:
+            bonuses.append(PHRASE_WEIGHT * sum(weights))
+    return bonuses
+
+
+def _deletes(word: str, max_distance: int) -> set[str]:
+    """Every string reachable from `word` by up to max_distance deletions."""
+    found = {word}
+    frontier = [word]
+    for _ in range(max_distance):
+        next_frontier = []
+        for w in frontier:
+            for i in range(len(w)):
+                variant = w[:i] + w[i + 1:]
+                if variant not in found:
+                    found.add(variant)
+                    next_frontier.append(variant)
+        frontier = next_frontier
+    return found
+
+
+def build_deletion_index(vocabulary, max_distance: int) -> dict[str, list[str]]:
+    """
+    SymSpell deletion-neighbourhood index: { deletion variant: [terms] }.
+    A typo and its intended term share a variant when they are within
+    max_distance edits, so lookups are a handful of dict probes.
+    """
+    index: dict[str, list[str]] = {}
+    for term in vocabulary:
+        for variant in _deletes(term[:FUZZY_PREFIX_LENGTH], max_distance):
+            index.setdefault(variant, []).append(term)
+    return index
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent
+    transpositions). Returns max_distance + 1 once it is exceeded.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2: list[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2]
+                    and a[i - 2] == b[j - 1]):
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], max_distance + 1)
+
+
+def build_intent_matrix(index: dict[str, dict[str, float]],
+                        intents: list[str]) -> tuple[dict[str, int], "np.ndarray"]:
+    """
+    Densify the inverted index into a token × intent weight matrix.
+    Returns ({ token: row }, matrix) with columns in `intents` order.
+    """
+    import numpy as np
+
+    columns = {intent: j for j, intent in enumerate(intents)}
+    vocab = {token: i for i, token in enumerate(index)}
+    matrix = np.zeros((len(vocab), len(intents)), dtype=np.float64)
+    for token, weights in index.items():
+        for intent, weight in weights.items():
+            matrix[vocab[token], columns[intent]] = weight
+    return vocab, matrix
+
+
+def kb_sources(kb_dir: str | None = None) -> list[str]:
+    """Knowledge base files in KB_DIR, in merge order."""
+    kb_dir = kb_dir or KB_DIR
+    return [
+        os.path.join(kb_dir, name) for name in sorted(os.listdir(kb_dir))
+        if name.endswith(KB_EXTENSIONS) and not name.startswith(".")
+    ]
+
+
+def _sources_stamp(paths: list[str]) -> tuple:
+    """Cheap change detector: (path, mtime, size) for every source."""
+    stamp = []
+    for path in paths:
+        st = os.stat(path)
+        stamp.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(stamp)
+
+
+def _parse_kb_file(path: str, raw: bytes) -> dict:
+    if path.endswith(".json"):
+        data = json.loads(raw)
+    else:
+        try:
+            import yaml
+        except ImportError as e:
+            raise ImportError(
+                f"{path}: YAML knowledge base files need PyYAML") from e
+        data = yaml.safe_load(raw)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: expected a mapping at the top level")
+    return data
+
+
+def _merge_kb_files(files: list[tuple[str, bytes]]) -> dict:
+    """Merge and validate parsed KB files into one source dict."""
+    source = {"intents": {}, "fallback_responses": [], "help_text": ""}
+    for path, raw in files:
+        data = _parse_kb_file(path, raw)
+        for intent, entry in data.get("intents", {}).items():
+            if (not isinstance(entry, dict)
+                    or not all(isinstance(p, str) for p in entry.get("patterns", []))
+                    or not entry.get("responses")
+                    or not all(isinstance(r, str) for r in entry["responses"])):
+                raise ValueError(
+                    f"{path}: intent {intent!r} needs string 'patterns' "
+                    "and a non-empty list of string 'responses'")
+            source["intents"][intent] = {
+                "patterns": list(entry.get("patterns", [])),
+                "responses": list(entry["responses"]),
+            }
+        source["fallback_responses"] += data.get("fallback_responses", [])
+        source["help_text"] = data.get("help_text", source["help_text"])
+    if not source["intents"] or not source["fallback_responses"]:
+        raise ValueError(
+            "Knowledge base needs at least one intent and one fallback response")
+    return source
+
+
+class CompiledKB:
+    """
+    One immutable knowledge base version, compiled for scoring. Callers
+    hold a reference for the whole request, so a hot reload never
+    changes the data under a request in flight.
+    """
+
+    def __init__(self, source: dict, version: str,
+                 index: dict[str, dict[str, int]] | None = None,
+                 phrases: list[tuple[tuple[str, ...], str]] | None = None):
+        self.source = source
+        self.version = version
+        self.knowledge_base = source["intents"]
+        self.fallback_responses = source["fallback_responses"]
+        self.help_text = source["help_text"]
+        self.intents = list(self.knowledge_base)
+        self.order = {intent: i for i, intent in enumerate(self.intents)}
+        self.index = (index if index is not None
+                      else build_intent_index(self.knowledge_base))
+        self.phrases = (phrases if phrases is not None
+                        else build_phrases(self.knowledge_base))
+        self.phrase_matcher = PhraseMatcher([words for words, _ in self.phrases])
+        self._bonuses: dict[str, list[float]] = {}
+        self._postings: dict[str, dict[str, dict[str, float]]] = {}
+        self._matrices: dict[str, tuple[dict[str, int], "np.ndarray"]] = {}
+        self._arrays: dict[str, dict[str, tuple["np.ndarray", "np.ndarray"]]] = {}
+        self._deletion_index: dict[str, list[str]] | None = None
+        self._corrections: dict[str, str | None] = {}
+
+    def prepare(self) -> "CompiledKB":
+        """
+        Build what scoring and typo correction would otherwise build lazily
+        inside the first request: postings and phrase bonuses for SCORING
+        and the deletion index. Called before a version is installed.
+        """
+        self.postings()
+        self.phrase_bonuses()
+        self.deletion_index()
+        return self
 
-    return best_intent if best_score > 0 else None
+    def deletion_index(self) -> dict[str, list[str]]:
+        """The SymSpell deletion index over the vocabulary, built on first use."""
+        if self._deletion_index is None and FUZZY_MAX_DISTANCE > 0:
+            self._deletion_index = build_deletion_index(
+                self.index, FUZZY_MAX_DISTANCE)
+        return self._deletion_index or {}
+
+    def postings(self, scoring: str | None = None) -> dict[str, dict[str, float]]:
+        """The inverted index weighted for `scoring`, built on first use."""
+        scoring = scoring or SCORING
+        weighted = self._postings.get(scoring)
+        if weighted is None:
+            weighted = self._postings[scoring] = weight_index(self.index, scoring)
+        return weighted
+
+    def correct(self, token: str, deadline: float | None = None) -> str | None:
+        """
+        Closest vocabulary token to a misspelled `token`, or None. Gives
+        up (uncached) once time.perf_counter() passes `deadline`.
+        """
+        if token in self._corrections:
+            return self._corrections[token]
+        deletion_index = self.deletion_index()
+        max_distance = min(FUZZY_MAX_DISTANCE, len(token) // FUZZY_MIN_LENGTH)
+        best, best_key = None, None
+        seen = set()
+        # Fewest deletions first, so the candidate cap drops the weakest
+        variants = sorted(_deletes(token[:FUZZY_PREFIX_LENGTH], max_distance),
+                          key=lambda v: (-len(v), v))
+        for variant in variants:
+            if len(seen) >= FUZZY_MAX_CANDIDATES:
+                break
+            for term in deletion_index.get(variant, ()):
+                if term in seen or abs(len(term) - len(token)) > max_distance:
+                    continue
+                if len(seen) >= FUZZY_MAX_CANDIDATES:
+                    break
+                if deadline is not None and time.perf_counter() > deadline:
+                    return None
+                seen.add(term)
+                distance = edit_distance(token, term, max_distance)
+                if distance > max_distance:
+                    continue
+                # Closest first, then the term used by the most patterns
+                key = (distance, -sum(self.index[term].values()), term)
+                if best_key is None or key < best_key:
+                    best, best_key = term, key
+        if len(self._corrections) >= LEMMA_CACHE_SIZE:
+            self._corrections.clear()
+        self._corrections[token] = best
+        return best
+
+    def phrase_bonuses(self, scoring: str | None = None) -> list[float]:
+        """Per-phrase score bonus under `scoring`, aligned with self.phrases."""
+        scoring = scoring or SCORING
+        bonuses = self._bonuses.get(scoring)
+        if bonuses is None:
+            bonuses = self._bonuses[scoring] = phrase_bonuses(
+                self.phrases, self.postings(scoring))
+        return bonuses
+
+    def find_phrases(self, text: str) -> set[int]:
+        """Ids (into self.phrases) of the phrases occurring in `text`."""
+        if PHRASE_WEIGHT <= 0 or not self.phrases:
+            return set()
+        return self.phrase_matcher.find(phrase_words(text))
+
+    def postings_arrays(self, scoring: str | None = None
+                        ) -> dict[str, tuple["np.ndarray", "np.ndarray"]]:
+        """{ token: (intent columns, weights) } for vectorized scoring."""
+        import numpy as np
+
+        scoring = scoring or SCORING
+        arrays = self._arrays.get(scoring)
+        if arrays is None:
+            arrays = self._arrays[scoring] = {
+                token: (np.fromiter((self.order[i] for i in weights), np.intp,
+                                    len(weights)),
+                        np.fromiter(weights.values(), np.float64, len(weights)))
+                for token, weights in self.postings(scoring).items()
+            }
+        return arrays
+
+    def matrix(self, scoring: str | None = None) -> tuple[dict[str, int], "np.ndarray"]:
+        """(vocab, token × intent matrix) for `scoring`, built on first batch call."""
+        scoring = scoring or SCORING
+        matrix = self._matrices.get(scoring)
+        if matrix is None:
+            matrix = self._matrices[scoring] = build_intent_matrix(
+                self.postings(scoring), self.intents)
+        return matrix
+
+    def to_snapshot(self) -> dict:
+        return {"format": SNAPSHOT_FORMAT, "version": self.version,
+                "source": self.source, "index": self.index,
+                "phrases": self.phrases}
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> "CompiledKB":
+        return cls(snapshot["source"], snapshot["version"], snapshot["index"],
+                   [(tuple(words), intent) for words, intent in snapshot["phrases"]])
+
+
+def _read_snapshot(path: str, version: str) -> CompiledKB | None:
+    """The snapshot at `path` if it was compiled from sources with this
+    version; None when it is missing, stale or unreadable in any way."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            snapshot = json.load(fh)
+        if snapshot.get("format") != SNAPSHOT_FORMAT or snapshot["version"] != version:
+            return None
+        return CompiledKB.from_snapshot(snapshot)
+    except FileNotFoundError:
+        return None
+    except Exception:
+        logger.warning("Ignoring unreadable knowledge base snapshot %s", path,
+                       exc_info=True)
+        return None
+
+
+def _write_snapshot(kb: CompiledKB, path: str):
+    """Write atomically (temp file + rename); a read-only KB_DIR is fine."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(kb.to_snapshot(), fh, ensure_ascii=False)
+        os.replace(tmp, path)
+    except (OSError, TypeError, ValueError):
+        # TypeError/ValueError: YAML sources with values JSON cannot hold
+        logger.warning("Could not write knowledge base snapshot %s", path)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def load_compiled_kb(kb_dir: str | None = None,
+                     use_snapshot: bool = True) -> tuple[CompiledKB, tuple]:
+    """
+    Load the knowledge base in KB_DIR. Returns (CompiledKB, stamp).
+    The snapshot is used when it was built from byte-identical sources;
+    otherwise the patterns are re-lemmatized and a new snapshot written.
+    Either way the KB is prepare()d here, on the loading thread, so no
+    request pays for its indexes after a (re)load.
+    """
+    paths = kb_sources(kb_dir)
+    stamp = _sources_stamp(paths)   # before reading: edits mid-load re-trigger
+    files = []
+    digest = hashlib.sha256(f"format={SNAPSHOT_FORMAT}".encode())
+    for path in paths:
+        with open(path, "rb") as fh:
+            raw = fh.read()
+        files.append((path, raw))
+        digest.update(os.path.basename(path).encode() + b"\0" + raw + b"\0")
+    version = digest.hexdigest()[:16]
+
+    snapshot_path = (KB_SNAPSHOT if kb_dir is None
+                     else os.path.join(kb_dir, ".compiled.json"))
+    kb = _read_snapshot(snapshot_path, version) if use_snapshot else None
+    if kb is None:
+        kb = CompiledKB(_merge_kb_files(files), version)
+        _write_snapshot(kb, snapshot_path)
+    return kb.prepare(), stamp
+
+
+_load_lock = threading.Lock()         # serializes the first load
+_compiled_lock = threading.Lock()     # guards the fields below
+_compiled: CompiledKB | None = None
+_compiled_stamp: tuple | None = None
+_failed_stamp: tuple | None = None
+_next_check = 0.0
+_reload_thread: threading.Thread | None = None
+
+
+def _install(kb: CompiledKB, stamp: tuple):
+    global _compiled, _compiled_stamp, _next_check
+    with _compiled_lock:
+        changed = _compiled is not None and _compiled.version != kb.version
+        _compiled, _compiled_stamp = kb, stamp
+        _next_check = time.monotonic() + KB_RELOAD_INTERVAL
+    if changed:
+        # Keys include the version, so this only frees the stale entries
+        _result_cache.clear(reset_stats=False)
+
+
+def compiled_kb() -> CompiledKB:
+    """
+    Return the current compiled knowledge base, loading it on first use.
+    With hot reload on, also starts a background reload when the source
+    files changed; requests keep the old version until it is swapped in.
+    """
+    kb = _compiled
+    if kb is None:
+        with _load_lock:
+            if _compiled is None:
+                _install(*load_compiled_kb())
+            return _compiled
+    if KB_RELOAD_INTERVAL > 0 and time.monotonic() >= _next_check:
+        _check_for_changes()
+    return kb
+
+
+def _check_for_changes():
+    global _next_check, _reload_thread
+    with _compiled_lock:
+        if time.monotonic() < _next_check:
+            return      # another thread just checked
+        _next_check = time.monotonic() + KB_RELOAD_INTERVAL
+        if _reload_thread is not None and _reload_thread.is_alive():
+            return
+        try:
+            stamp = _sources_stamp(kb_sources())
+        except OSError:
+            return
+        if stamp in (_compiled_stamp, _failed_stamp):
+            return
+        _reload_thread = threading.Thread(
+            target=_reload_in_background, name="KBReload", daemon=True)
+        _reload_thread.start()
+
+
+def _reload_in_background():
+    global _failed_stamp
+    try:
+        kb, stamp = load_compiled_kb()
+    except Exception:
+        try:
+            _failed_stamp = _sources_stamp(kb_sources())
+        except OSError:
+            pass
+        logger.exception("Knowledge base reload failed; keeping version %s",
+                         _compiled.version if _compiled else None)
+        return
+    _install(kb, stamp)
+    logger.info("Knowledge base reloaded: version %s", kb.version)
+
+
+def reload_kb(use_snapshot: bool = True) -> CompiledKB:
+    """Reload the knowledge base now (raises if the sources are invalid)."""
+    kb, stamp = load_compiled_kb(use_snapshot=use_snapshot)
+    _install(kb, stamp)
+    return kb
+
+
+def knowledge_base() -> dict:
+    """The current { intent: { "patterns", "responses" } } mapping."""
+    return compiled_kb().knowledge_base
+
+
+def __getattr__(name: str):
+    # KNOWLEDGE_BASE, FALLBACK_RESPONSES and HELP_TEXT used to be module
+    # constants; they now always reflect the current compiled version.
+    if name == "KNOWLEDGE_BASE":
+        return compiled_kb().knowledge_base
+    if name == "FALLBACK_RESPONSES":
+        return compiled_kb().fallback_responses
+    if name == "HELP_TEXT":
+        return compiled_kb().help_text
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def score_intents(user_tokens: list[str], kb: CompiledKB | None = None,
+                  scoring: str | None = None,
+                  phrase_hits: set[int] = frozenset()) -> dict[str, float]:
+    """
+    Return { intent: score } for every intent sharing a token with the
+    user, plus the bonus of every phrase in `phrase_hits`.
+    """
+    kb = kb or compiled_kb()
+    postings = kb.postings(scoring)
+    scores: dict[str, float] = {}
+    for token in set(user_tokens):
+        for intent, weight in postings.get(token, {}).items():
+            scores[intent] = scores.get(intent, 0) + weight
+    if phrase_hits:
+        bonuses = kb.phrase_bonuses(scoring)
+        for phrase_id in sorted(phrase_hits):
+            if bonuses[phrase_id]:
+                intent = kb.phrases[phrase_id][1]
+                scores[intent] = scores.get(intent, 0) + bonuses[phrase_id]
+    return scores
+
+
+def _rank_vectorized(user_tokens: list[str], k: int, kb: CompiledKB,
+                     scoring: str | None,
+                     phrase_hits: set[int]) -> list[tuple[str, float]]:
+    import numpy as np
+
+    arrays = kb.postings_arrays(scoring)
+    scores = np.zeros(len(kb.intents))
+    for token in set(user_tokens):
+        posting = arrays.get(token)
+        if posting is not None:
+            scores[posting[0]] += posting[1]
+    if phrase_hits:
+        bonuses = kb.phrase_bonuses(scoring)
+        for phrase_id in sorted(phrase_hits):
+            scores[kb.order[kb.phrases[phrase_id][1]]] += bonuses[phrase_id]
+    hits = np.flatnonzero(scores)
+    if len(hits) > k:
+        # Keep everything tied with the k-th best so ties break by order
+        kth = np.partition(scores[hits], len(hits) - k)[len(hits) - k]
+        hits = hits[scores[hits] >= kth]
+    best = hits[np.lexsort((hits, -scores[hits]))][:k]
+    return [(kb.intents[j], float(scores[j])) for j in best]
+
+
+def rank_intents(user_tokens: list[str], k: int = 5,
+                 kb: CompiledKB | None = None, scoring: str | None = None,
+                 phrase_hits: set[int] = frozenset()) -> list[tuple[str, float]]:
+    """Return the top `k` (intent, score) pairs, best first."""
+    kb = kb or compiled_kb()
+    if len(kb.intents) >= VECTOR_SCORING_MIN_INTENTS:
+        return _rank_vectorized(user_tokens, k, kb, scoring, phrase_hits)
+    scores = score_intents(user_tokens, kb, scoring, phrase_hits)
+    # Ties go to the intent defined first in the knowledge base
+    order = kb.order
+    best = heapq.nsmallest(k, scores, key=lambda i: (-scores[i], order[i]))
+    return [(intent, scores[intent]) for intent in best]
+
+
+def match_intent(user_tokens: list[str], kb: CompiledKB | None = None,
+                 scoring: str | None = None,
+                 phrase_hits: set[int] = frozenset()) -> str | None:
+    """Return the best-matching intent key, or None."""
+    ranked = rank_intents(user_tokens, 1, kb, scoring, phrase_hits)
+    return ranked[0][0] if ranked else None
+
+
+def correct_tokens(user_tokens: list[str], kb: CompiledKB | None = None,
+                   budget_ms: float | None = None) -> list[str]:
+    """
+    Replace tokens the knowledge base has never seen with their closest
+    vocabulary token. Real words ("truck", "honey") are left alone: only
+    tokens WordNet does not know are treated as typos. Stops correcting
+    once `budget_ms` (default FUZZY_BUDGET_MS) is spent, leaving the rest
+    as typed.
+    """
+    return _correct_tokens(user_tokens, kb, budget_ms)[0]
+
+
+def _correct_tokens(user_tokens: list[str], kb: CompiledKB | None,
+                    budget_ms: float | None) -> tuple[list[str], bool]:
+    """correct_tokens(), plus False if the budget ran out before every
+    token was looked at (the result then depends on timing)."""
+    if FUZZY_MAX_DISTANCE <= 0:
+        return user_tokens, True
+    kb = kb or compiled_kb()
+    start = time.perf_counter()
+    deadline = start + (FUZZY_BUDGET_MS if budget_ms is None else budget_ms) / 1000
+    corrected = list(user_tokens)
+    complete = True
+    for i, token in enumerate(user_tokens):
+        if token in kb.index or len(token) < FUZZY_MIN_LENGTH:
+            continue
+        if time.perf_counter() > deadline:
+            complete = False
+            break
+        if _dictionary_word(token):
+            continue
+        fix = kb.correct(token, deadline)
+        if fix is None and time.perf_counter() > deadline:
+            complete = False
+            break
+        corrected[i] = fix or token
+    metrics.record("fuzzy", time.perf_counter() - start)
+    return corrected, complete
+
+
+def _classify_tokens(stripped: str, tokens: list[str]) -> dict | None:
+    """Handle the help / empty special cases; None means 'score me'."""
+    if stripped in HELP_COMMANDS:
+        return {"intent": "help", "confidence": "high"}
+    if not tokens:
+        return {"intent": "empty", "confidence": "n/a"}
+    return None
+
+
+def _scored(intent: str | None, tokens: list[str]) -> dict:
+    if intent is None:
+        return {"intent": "unknown", "confidence": "low"}
+    return {"intent": intent,
+            "confidence": "high" if len(tokens) >= 2 else "medium"}
+
+
+def classify(user_message: str, kb: CompiledKB | None = None) -> dict:
+    """
+    Returns a dict:
+        { "intent": str, "confidence": str }
+    Results are cached per normalized message and KB version; callers
+    get a copy, so the response is still picked fresh each time. Results
+    whose typo correction ran out of time are not cached.
+    """
+    kb = kb or compiled_kb()
+    key = (kb.version, SCORING, " ".join(user_message.lower().split()))
+    cached = _result_cache.get(key)
+    if cached is not None:
+        return dict(cached)
+    result, complete = _classify_uncached(user_message, kb)
+    if complete:
+        _result_cache.put(key, dict(result))
+    return result
+
+
+def _classify_uncached(user_message: str, kb: CompiledKB) -> tuple[dict, bool]:
+    stripped = user_message.strip().lower()
+    with metrics.timed("preprocess"):
+        tokens = [] if stripped in HELP_COMMANDS else preprocess(user_message)
+    special = _classify_tokens(stripped, tokens)
+    if special:
+        return special, True
+    tokens, complete = _correct_tokens(tokens, kb, None)
+    with metrics.timed("score"):
+        intent = match_intent(tokens, kb,
+                              phrase_hits=kb.find_phrases(user_message))
+    return _scored(intent, tokens), complete
+
+
+def classify_batch(messages: list[str],
+                   kb: CompiledKB | None = None) -> list[dict]:
+    """
+    Classify many messages at once. Scores are computed as a
+    (message × token) @ (token × intent) matrix product per chunk;
+    results are identical to calling classify() on each message (up to
+    float rounding on exact ties under tfidf / bm25). Knowledge bases too
+    large for a dense matrix are scored message by message.
+    """
+    results: list[dict | None] = [None] * len(messages)
+    pending: list[tuple[int, list[str], set[int]]] = []
+    kb = kb or compiled_kb()
+
+    for i, message in enumerate(messages):
+        stripped = message.strip().lower()
+        tokens = [] if stripped in HELP_COMMANDS else preprocess(message)
+        results[i] = _classify_tokens(stripped, tokens)
+        if results[i] is None:
+            pending.append((i, correct_tokens(tokens, kb),
+                            kb.find_phrases(message)))
+
+    if not pending:
+        return results
+
+    if len(kb.index) * len(kb.intents) > MATRIX_MAX_CELLS:
+        for i, tokens, phrase_hits in pending:
+            intent = match_intent(tokens, kb, phrase_hits=phrase_hits)
+            results[i] = _scored(intent, tokens)
+        return results
+
+    import numpy as np
+
+    vocab, matrix = kb.matrix()
+    bonuses = kb.phrase_bonuses()
+    chunk_size = max(1, min(BATCH_CHUNK_SIZE, MATRIX_MAX_CELLS // max(1, len(vocab))))
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        rows, cols = [], []
+        for r, (_, tokens, _) in enumerate(chunk):
+            for token in set(tokens):
+                col = vocab.get(token)
+                if col is not None:
+                    rows.append(r)
+                    cols.append(col)
+        hits = np.zeros((len(chunk), len(vocab)), dtype=np.float64)
+        hits[rows, cols] = 1.0
+        scores = hits @ matrix
+        for r, (_, _, phrase_hits) in enumerate(chunk):
+            for phrase_id in sorted(phrase_hits):
+                scores[r, kb.order[kb.phrases[phrase_id][1]]] += bonuses[phrase_id]
+        # argmax returns the first maximum, matching dict-order tie-breaks
+        best = scores.argmax(axis=1)
+        best_score = scores[np.arange(len(chunk)), best]
+        for r, (i, tokens, _) in enumerate(chunk):
+            intent = kb.intents[best[r]] if best_score[r] > 0 else None
+            results[i] = _scored(intent, tokens)
+
+    return results
+
+
+def respond(result: dict, kb: CompiledKB | None = None) -> dict:
+    """Attach a response text to a classification result."""
+    kb = kb or compiled_kb()
+    intent = result["intent"]
+    entry = kb.knowledge_base.get(intent)
+    if intent == "help":
+        response = kb.help_text
+    elif intent == "empty":
+        response = EMPTY_RESPONSE
+    elif entry is not None:
+        response = random.choice(entry["responses"])
+    else:
+        # "unknown", or an intent removed by a reload since classification
+        response = random.choice(kb.fallback_responses)
+    return {"response": response, **result}
 
 
 def get_response(user_message: str) -> dict:
@@ -190,29 +1148,210 @@ def get_response(user_message: str) -> dict:
     Returns a dict:
         { "response": str, "intent": str, "confidence": str }
     """
-    stripped = user_message.strip().lower()
+    kb = compiled_kb()
+    result = classify(user_message, kb)
+    with metrics.timed("respond"):
+        return respond(result, kb)
 
-    # Help shortcut
-    if stripped in ("help", "?", "menu", "commands"):
-        return {"response": HELP_TEXT, "intent": "help", "confidence": "high"}
 
-    tokens = preprocess(user_message)
+def get_responses(messages: list[str]) -> list[dict]:
+    """Batch version of get_response(), scored with classify_batch()."""
+    kb = compiled_kb()
+    return [respond(result, kb) for result in classify_batch(messages, kb)]
 
-    if not tokens:
+
+# ─────────────────────────────────────────────
+#  SHARED ENGINE  — one per process
+# ─────────────────────────────────────────────
+class Engine:
+    """
+    Process-wide handle on the knowledge base, its compiled scoring
+    structures, the stopword set and the lemmatizer. The underlying state
+    is module-level and lock-protected, so one Engine can serve every
+    thread (Streamlit session, API request) in the process; get_engine()
+    returns that instance.
+    """
+
+    def __init__(self):
+        self._warm_lock = threading.Lock()
+        self._warm_thread: threading.Thread | None = None
+        self.warmup_seconds: float | None = None
+
+    @property
+    def kb(self) -> CompiledKB:
+        return compiled_kb()
+
+    @property
+    def stop_words(self) -> frozenset[str]:
+        return _load_nltk()[1]
+
+    @property
+    def lemmatizer(self):
+        return _load_nltk()[2]
+
+    @property
+    def warm(self) -> bool:
+        return self.warmup_seconds is not None
+
+    def warm_up(self) -> float:
+        """
+        Load everything the first message would otherwise pay for: NLTK
+        data (including the punkt model and WordNet), the compiled KB
+        and its scoring, phrase and typo indexes. Idempotent; returns the
+        seconds spent.
+        """
+        with self._warm_lock:
+            if self.warmup_seconds is None:
+                start = time.perf_counter()
+                _load_nltk()
+                compiled_kb()       # prepared by load_compiled_kb()
+                self.warmup_seconds = time.perf_counter() - start
+            return self.warmup_seconds
+
+    def warm_up_in_background(self) -> threading.Thread:
+        """Start warm_up() in a daemon thread (once) and return it."""
+        with self._warm_lock:
+            if self._warm_thread is None:
+                self._warm_thread = threading.Thread(
+                    target=self.warm_up, name="EngineWarmup", daemon=True)
+                self._warm_thread.start()
+            return self._warm_thread
+
+    def classify(self, user_message: str) -> dict:
+        return classify(user_message)
+
+    def get_response(self, user_message: str) -> dict:
+        return get_response(user_message)
+
+    def get_responses(self, messages: list[str]) -> list[dict]:
+        return get_responses(messages)
+
+    def stats(self) -> dict:
+        """Warm-up state, KB size, cache counters and process memory."""
+        kb = _compiled
         return {
-            "response": "Please type a message so I can help you! 😊",
-            "intent": "empty",
-            "confidence": "n/a",
+            "warm": self.warm,
+            "warmup_seconds": self.warmup_seconds,
+            "kb_version": kb.version if kb else None,
+            "intents": len(kb.intents) if kb else 0,
+            "caches": cache_stats(),
+            "memory": metrics.process_memory(),
         }
 
-    intent = match_intent(tokens)
 
-    if intent:
-        response = random.choice(KNOWLEDGE_BASE[intent]["responses"])
-        confidence = "high" if len(tokens) >= 2 else "medium"
-    else:
-        response = random.choice(FALLBACK_RESPONSES)
-        intent = "unknown"
-        confidence = "low"
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """Return this process's shared Engine, creating it on first call."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = Engine()
+        return _engine
+
+
+# ─────────────────────────────────────────────
+#  CLI  — python -m chatbot_engine --warmup
+# ─────────────────────────────────────────────
+def warmup() -> float:
+    """Fetch missing NLTK data, then warm the shared engine.
+    Returns the elapsed seconds."""
+    start = time.perf_counter()
+    missing = missing_nltk_data()
+    if missing:
+        download_nltk_data(missing)
+    get_engine().warm_up()
+    return time.perf_counter() - start
+
+
+def measure_import_time() -> float:
+    """Import this module in a fresh interpreter; return milliseconds."""
+    import subprocess
+
+    code = ("import time; t = time.perf_counter(); import chatbot_engine; "
+            "print((time.perf_counter() - t) * 1000)")
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True,
+        check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return float(out.stdout.strip())
+
+
+# Messages that once routed to the wrong intent, with the intent they
+# must reach under the default overlap scoring; `--check-routing` fails
+# if any regresses
+ROUTING_CASES = (
+    ("do you offer refunds", "refund"),
+    ("who are you going to send my refund to", "refund"),
+    ("how much longer until my order arrives", "shipping"),
+    ("What can I do about my password?", "password"),
+    ("my app is not working", "bug"),
+    ("I want my money back", "refund"),
+    ("what are your working hours", "hours"),
+    ("can I talk to someone", "contact"),
+    ("how much is it", "pricing"),
+    ("I am locked out", "password"),
+)
+
+
+def check_routing() -> list[tuple[str, str, str]]:
+    """(message, expected, got) for every ROUTING_CASES entry that misroutes."""
+    engine = get_engine()
+    failures = []
+    for message, expected in ROUTING_CASES:
+        got = engine.classify(message)["intent"]
+        if got != expected:
+            failures.append((message, expected, got))
+    return failures
+
+
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m chatbot_engine")
+    parser.add_argument("--warmup", action="store_true",
+                        help="download missing NLTK data and compile the KB")
+    parser.add_argument("--compile-kb", action="store_true",
+                        help="rebuild the knowledge base snapshot from KB_DIR")
+    parser.add_argument("--check", action="store_true",
+                        help="report missing NLTK data without touching the network")
+    parser.add_argument("--check-routing", action="store_true",
+                        help="fail if any ROUTING_CASES message misroutes")
+    parser.add_argument("--check-import", action="store_true",
+                        help=f"fail if import takes over {IMPORT_TIME_BUDGET_MS} ms")
+    args = parser.parse_args(argv)
+
+    status = 0
+    if args.warmup:
+        print(f"Warmup done in {warmup():.2f}s")
+    if args.compile_kb:
+        kb = reload_kb(use_snapshot=False)
+        print(f"Compiled {len(kb.intents)} intents from {KB_DIR} "
+              f"(version {kb.version})")
+    if args.check:
+        missing = missing_nltk_data()
+        print("Missing NLTK data: " + (", ".join(missing) or "none"))
+        status |= bool(missing)
+    if args.check_routing:
+        failures = check_routing()
+        for message, expected, got in failures:
+            print(f"MISROUTED {message!r}: expected {expected}, got {got}")
+        print(f"Routing: {len(ROUTING_CASES) - len(failures)}/"
+              f"{len(ROUTING_CASES)} OK")
+        status |= bool(failures)
+    if args.check_import:
+        ms = measure_import_time()
+        ok = ms <= IMPORT_TIME_BUDGET_MS
+        print(f"Import time: {ms:.1f} ms (budget {IMPORT_TIME_BUDGET_MS} ms) "
+              f"{'OK' if ok else 'OVER BUDGET'}")
+        status |= not ok
+    if not (args.warmup or args.compile_kb or args.check or args.check_routing
+            or args.check_import):
+        parser.print_help()
+    return status
+
 
-    return {"response": response, "intent": intent, "confidence": confidence}
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,144 @@
 import sqlite3
 import os
-from datetime import datetime
+import atexit
+import csv
+import gzip
+import io
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-DB_PATH = "chat_logs.db"
+DB_PATH = os.environ.get("CHATBOT_DB_PATH", "chat_logs.db")
 
+# Idle connections kept open per database file
+POOL_SIZE = int(os.environ.get("CHATBOT_DB_POOL_SIZE", "8"))
 
-def init_db():
-    """Create tables if they don't exist."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("""
+# Applied to every new connection. WAL lets dashboard readers and chat
+# writers run concurrently; NORMAL sync is durable across app crashes in WAL.
+PRAGMAS = {
+    # Lets retention hand freed pages back in small steps. Only takes
+    # effect on new files; see enable_incremental_vacuum() for old ones.
+    "auto_vacuum": "INCREMENTAL",
+    "busy_timeout": 5000,      # ms to wait on a locked database
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,      # negative = KiB, i.e. 16 MB page cache
+    "temp_store": "MEMORY",
+}
+
+# Set CHATBOT_WRITE_BEHIND=1 to log through a background LogWriter
+WRITE_BEHIND = os.environ.get("CHATBOT_WRITE_BEHIND", "0") == "1"
+
+# Archive and delete conversations older than this many days (0 = keep
+# everything); archives go to CHATBOT_ARCHIVE_DIR, default chat_archive/
+# next to the database
+RETENTION_DAYS = int(os.environ.get("CHATBOT_RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.environ.get("CHATBOT_ARCHIVE_DIR")
+
+logger = logging.getLogger(__name__)
+
+
+# ─────────────────────────────────────────────
+#  CONNECTION MANAGEMENT
+# ─────────────────────────────────────────────
+class ConnectionPool:
+    """
+    Connections to one SQLite file, shared across threads. Each
+    connection is used by one thread at a time; up to `size` idle
+    connections are kept open for reuse.
+    """
+
+    def __init__(self, path: str, size: int = POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False,
+                               timeout=PRAGMAS["busy_timeout"] / 1000)
+        conn.row_factory = sqlite3.Row
+        for name, value in PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed or self._idle.qsize() >= self.size:
+                conn.close()
+            else:
+                self._idle.put(conn)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def configure(db_path: str | None = None, pool_size: int | None = None):
+    """Point the module at another database file and/or resize the pool."""
+    global DB_PATH, POOL_SIZE
+    if db_path is not None:
+        DB_PATH = db_path
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    close_connections()
+
+
+def close_connections():
+    """Close every idle pooled connection."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+def _get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(DB_PATH, POOL_SIZE)
+        return _pool
+
+
+@contextmanager
+def connect():
+    """Borrow a pooled connection; use `with conn:` for a transaction."""
+    with _get_pool().connection() as conn:
+        yield conn
+
+
+# ─────────────────────────────────────────────
+#  SCHEMA MIGRATIONS  — tracked in PRAGMA user_version
+# ─────────────────────────────────────────────
+def _migrate_v1(conn: sqlite3.Connection):
+    """Base tables (IF NOT EXISTS, so pre-migration databases adopt it)."""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS conversations (
             id          INTEGER PRIMARY KEY AUTOINCREMENT,
             session_id  TEXT NOT NULL,
@@ -20,95 +149,603 @@ def init_db():
             confidence  TEXT
         )
     """)
-    cur.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS sessions (
             session_id   TEXT PRIMARY KEY,
             started_at   TEXT NOT NULL,
             message_count INTEGER DEFAULT 0
         )
     """)
-    conn.commit()
-    conn.close()
 
 
-def log_message(session_id: str, role: str, message: str,
-                intent: str = None, confidence: str = None):
-    conn = sqlite3.connect(DB_PATH)
+def _migrate_v2(conn: sqlite3.Connection):
+    """Indexes for the dashboard queries."""
+    # Covers fetch_intent_stats (role filter + intent group) and the
+    # user-message count in fetch_total_stats
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_role_intent
+        ON conversations (role, intent)
+    """)
+    # Covers COUNT(DISTINCT session_id)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_session
+        ON conversations (session_id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_sessions_started_at
+        ON sessions (started_at)
+    """)
+
+
+def _migrate_v3(conn: sqlite3.Connection):
+    """Analytics rollups, kept current by triggers on conversations."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_roles (
+            role   TEXT PRIMARY KEY,
+            count  INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_intents (
+            intent TEXT PRIMARY KEY,
+            count  INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_counters (
+            name   TEXT PRIMARY KEY,
+            value  INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # The session counter only moves when a session gains its first or
+    # loses its last message; both checks use idx_conversations_session.
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_rollup_insert
+        AFTER INSERT ON conversations
+        BEGIN
+            INSERT INTO rollup_roles (role, count) VALUES (NEW.role, 1)
+                ON CONFLICT(role) DO UPDATE SET count = count + 1;
+            INSERT INTO rollup_intents (intent, count)
+                SELECT NEW.intent, 1
+                WHERE NEW.role = 'user' AND NEW.intent IS NOT NULL
+                ON CONFLICT(intent) DO UPDATE SET count = count + 1;
+            UPDATE rollup_counters SET value = value + 1
+                WHERE name = 'sessions' AND NOT EXISTS (
+                    SELECT 1 FROM conversations
+                    WHERE session_id = NEW.session_id AND id != NEW.id);
+        END
+    """)
+    conn.execute(ROLLUP_DELETE_TRIGGER)
+    _rebuild_rollups(conn)
+
+
+# Also dropped and recreated around clear_all_logs(): a per-row trigger
+# disables SQLite's truncate optimization for an unfiltered DELETE
+ROLLUP_DELETE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS trg_rollup_delete
+    AFTER DELETE ON conversations
+    BEGIN
+        UPDATE rollup_roles SET count = count - 1 WHERE role = OLD.role;
+        UPDATE rollup_intents SET count = count - 1
+            WHERE intent = OLD.intent AND OLD.role = 'user';
+        UPDATE rollup_counters SET value = value - 1
+            WHERE name = 'sessions' AND NOT EXISTS (
+                SELECT 1 FROM conversations
+                WHERE session_id = OLD.session_id);
+    END
+"""
+
+
+def _migrate_v4(conn: sqlite3.Connection):
+    """Indexes for the filtered log browser (rowid order comes for free)."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_intent
+        ON conversations (intent)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_conversations_timestamp
+        ON conversations (timestamp)
+    """)
+
+
+def _migrate_v5(conn: sqlite3.Connection):
+    """Persisted per-stage latency snapshots (see metrics.persist)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stage_metrics (
+            id           INTEGER PRIMARY KEY AUTOINCREMENT,
+            recorded_at  TEXT NOT NULL,
+            stage        TEXT NOT NULL,
+            count        INTEGER NOT NULL,
+            mean_ms      REAL,
+            p50_ms       REAL,
+            p95_ms       REAL,
+            p99_ms       REAL
+        )
+    """)
+
+
+# MIGRATIONS[i] upgrades a database from user_version i to i + 1
+MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3, _migrate_v4,
+              _migrate_v5]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version() -> int:
+    with connect() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate() -> int:
+    """
+    Apply pending migrations in place, one transaction per version, and
+    return the resulting schema version. Safe to run concurrently from
+    several processes: BEGIN IMMEDIATE serializes them.
+    """
+    with connect() as conn:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version >= SCHEMA_VERSION:
+                    conn.rollback()
+                    return version
+                MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+
+def init_db():
+    """Create or upgrade the schema to SCHEMA_VERSION."""
+    migrate()
+
+
+def _rebuild_rollups(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM rollup_roles")
+    conn.execute("""
+        INSERT INTO rollup_roles (role, count)
+        SELECT role, COUNT(*) FROM conversations GROUP BY role
+    """)
+    conn.execute("DELETE FROM rollup_intents")
+    conn.execute("""
+        INSERT INTO rollup_intents (intent, count)
+        SELECT intent, COUNT(*) FROM conversations
+        WHERE role = 'user' AND intent IS NOT NULL
+        GROUP BY intent
+    """)
+    conn.execute("""
+        INSERT OR REPLACE INTO rollup_counters (name, value)
+        SELECT 'sessions', COUNT(DISTINCT session_id) FROM conversations
+    """)
+
+
+def rebuild_rollups():
+    """Recompute every rollup table from conversations."""
+    with connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _rebuild_rollups(conn)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+
+# Bumped after every committed change to conversations/sessions in this
+# process, so readers can key caches on it (see app.py)
+_write_generation = 0
+_generation_lock = threading.Lock()
+
+
+def write_generation() -> int:
+    """Return a counter that changes whenever this process writes logs."""
+    return _write_generation
+
+
+def _bump_generation():
+    global _write_generation
+    with _generation_lock:
+        _write_generation += 1
+
+
+def _write_records(records: list[tuple]):
+    """Write (session_id, timestamp, role, message, intent, confidence)
+    records in a single transaction."""
+    with connect() as conn, conn:
+        _insert_records(conn, records)
+    _bump_generation()
+
+
+def _insert_records(conn: sqlite3.Connection, records: list[tuple]):
     cur = conn.cursor()
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Upsert session
-    cur.execute("""
+    # Upsert sessions
+    cur.executemany("""
         INSERT INTO sessions (session_id, started_at, message_count)
         VALUES (?, ?, 1)
         ON CONFLICT(session_id) DO UPDATE SET
             message_count = message_count + 1
-    """, (session_id, now))
+    """, [(r[0], r[1]) for r in records])
 
-    # Insert message
-    cur.execute("""
+    # Insert messages
+    cur.executemany("""
         INSERT INTO conversations
             (session_id, timestamp, role, message, intent, confidence)
         VALUES (?, ?, ?, ?, ?, ?)
-    """, (session_id, now, role, message, intent, confidence))
+    """, records)
+
+
+def log_message(session_id: str, role: str, message: str,
+                intent: str = None, confidence: str = None):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    record = (session_id, now, role, message, intent, confidence)
+    if _writer is not None:
+        _writer.submit(record)
+    else:
+        _write_records([record])
+
+
+# ─────────────────────────────────────────────
+#  WRITE-BEHIND LOGGING
+# ─────────────────────────────────────────────
+BACKPRESSURE_POLICIES = ("block", "drop", "sync")
+
+_FLUSH = object()
+_STOP = object()
+
+
+class LogWriter:
+    """
+    Background thread that takes log records off a bounded queue and
+    writes them in batched transactions, once `batch_size` records are
+    waiting or `flush_interval` seconds after the first one arrived.
+
+    When the queue is full, `policy` decides what submit() does:
+        "block" — wait for room (never loses records; the caller stalls)
+        "drop"  — discard the record and count it in stats()["dropped"]
+        "sync"  — write the record directly from the caller's thread
+    """
+
+    def __init__(self, batch_size: int = 200, flush_interval: float = 0.5,
+                 max_queue: int = 10000, policy: str = "block"):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"policy must be one of {BACKPRESSURE_POLICIES}")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._counts = {"written": 0, "batches": 0, "dropped": 0,
+                        "sync": 0, "failed": 0}
+        self._thread = threading.Thread(
+            target=self._run, name="LogWriter", daemon=True)
+        self._thread.start()
+
+    def submit(self, record: tuple):
+        if self.policy == "block":
+            self._queue.put(record)
+            return
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.policy == "sync":
+                _write_records([record])
+            with self._lock:
+                self._counts["dropped" if self.policy == "drop" else "sync"] += 1
 
-    conn.commit()
-    conn.close()
+    def flush(self, timeout: float | None = None) -> bool:
+        """Block until every record submitted so far is committed."""
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        return done.wait(timeout)
+
+    def shutdown(self, timeout: float | None = None):
+        """Flush what is queued and stop the thread."""
+        if self._thread.is_alive():
+            self._queue.put((_STOP, None))
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._counts, "queued": self._queue.qsize()}
+
+    def _commit(self, batch: list[tuple]):
+        if not batch:
+            return
+        written = failed = 0
+        try:
+            _write_records(batch)
+            written = len(batch)
+        except sqlite3.Error:
+            # One bad record must not sink the rest: retry them one by one
+            for record in batch:
+                try:
+                    _write_records([record])
+                    written += 1
+                except sqlite3.Error:
+                    logger.exception("LogWriter failed to write %r", record[:3])
+                    failed += 1
+        with self._lock:
+            self._counts["written"] += written
+            self._counts["failed"] += failed
+            self._counts["batches"] += 1
+        batch.clear()
+
+    def _run(self):
+        batch: list[tuple] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._commit(batch)
+                continue
+
+            if item[0] is _FLUSH or item[0] is _STOP:
+                self._commit(batch)
+                if item[0] is _STOP:
+                    return
+                item[1].set()
+                continue
+
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                self._commit(batch)
+
+
+_writer: LogWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def start_log_writer(**kwargs) -> LogWriter:
+    """Route log_message() through a background LogWriter (idempotent)."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = LogWriter(**kwargs)
+            atexit.register(stop_log_writer)
+    return _writer
+
+
+def stop_log_writer(timeout: float | None = None):
+    """Flush and stop the background writer; log_message() writes inline again."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.shutdown(timeout)
+
+
+def flush_logs(timeout: float | None = None) -> bool:
+    """Wait until queued log records are committed (no-op without a writer)."""
+    writer = _writer
+    return writer.flush(timeout) if writer is not None else True
 
 
 def fetch_all_logs() -> list[dict]:
     """Return all conversation logs as list of dicts."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT * FROM conversations ORDER BY id DESC LIMIT 500
-    """)
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+    with connect() as conn:
+        cur = conn.execute("""
+            SELECT * FROM conversations ORDER BY id DESC LIMIT 500
+        """)
+        return [dict(r) for r in cur.fetchall()]
+
+
+def fetch_logs_page(after_id: int | None = None, limit: int = 100,
+                    session_id: str | None = None, intent: str | None = None,
+                    role: str | None = None,
+                    since: str | None = None) -> list[dict]:
+    """
+    Return up to `limit` logs, newest first, matching every filter given.
+    Keyset pagination: pass the last row's id as `after_id` to get the
+    next (older) page. `since` is a "YYYY-MM-DD[ HH:MM:SS]" lower bound
+    on timestamp.
+    """
+    where, params = _log_filters(session_id, intent, role, since)
+    if after_id is not None:
+        where.append("id < ?")
+        params.append(after_id)
+
+    sql = "SELECT * FROM conversations"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+
+    with connect() as conn:
+        return [dict(r) for r in conn.execute(sql, params).fetchall()]
+
+
+def _log_filters(session_id: str | None = None, intent: str | None = None,
+                 role: str | None = None,
+                 since: str | None = None) -> tuple[list[str], list]:
+    """WHERE clauses and parameters shared by the log readers."""
+    where, params = [], []
+    for column, value in (("session_id", session_id), ("intent", intent),
+                          ("role", role)):
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value)
+    if since is not None:
+        where.append("timestamp >= ?")
+        params.append(str(since))
+    return where, params
+
+
+# ─────────────────────────────────────────────
+#  STREAMING EXPORT
+# ─────────────────────────────────────────────
+EXPORT_COLUMNS = ["id", "timestamp", "session_id", "role",
+                  "message", "intent", "confidence"]
+EXPORT_CHUNK_SIZE = 5000
+
+
+def iter_log_chunks(chunk_size: int = EXPORT_CHUNK_SIZE,
+                    newest_first: bool = False,
+                    **filters) -> Iterator[list[tuple]]:
+    """
+    Yield conversations rows (EXPORT_COLUMNS order, oldest first unless
+    `newest_first`) in chunks of at most `chunk_size`. Each chunk is its
+    own keyset query on id, so no read transaction stays open between
+    chunks and the WAL can keep checkpointing during long exports.
+    """
+    where, params = _log_filters(**filters)
+    keyset, order = ("id < ?", "id DESC") if newest_first else ("id > ?", "id")
+    sql = (f"SELECT {', '.join(EXPORT_COLUMNS)} FROM conversations "
+           f"WHERE {' AND '.join(where + [keyset])} "
+           f"ORDER BY {order} LIMIT ?")
+    last_id = (1 << 63) - 1 if newest_first else 0
+    while True:
+        with connect() as conn:
+            rows = conn.execute(sql, [*params, last_id, chunk_size]).fetchall()
+        if not rows:
+            return
+        yield [tuple(r) for r in rows]
+        last_id = rows[-1][0]
+
+
+def export_logs(dest, fmt: str | None = None, compress: bool | None = None,
+                chunk_size: int = EXPORT_CHUNK_SIZE, max_rows: int | None = None,
+                newest_first: bool = False, **filters) -> int:
+    """
+    Stream conversations to `dest` (a path, or a binary file object for
+    CSV) chunk by chunk and return the number of rows written. Memory
+    use is bounded by `chunk_size` whatever the table size.
+
+    fmt is "csv" or "parquet" (inferred from a path's extension when
+    omitted); compress gzips CSV (default: path ends with ".gz").
+    Parquet needs the optional `pyarrow` package. `max_rows` stops after
+    that many rows; with `newest_first` those are the newest rows.
+    """
+    return write_export(dest, iter_log_chunks(chunk_size, newest_first,
+                                              **filters),
+                        fmt, compress, max_rows)
+
+
+def write_export(dest, chunks: Iterator[list[tuple]], fmt: str | None = None,
+                 compress: bool | None = None, max_rows: int | None = None) -> int:
+    """Write chunks of EXPORT_COLUMNS rows as export_logs() does; shared
+    with the other storage backends."""
+    if max_rows is not None:
+        chunks = _first_rows(chunks, max_rows)
+    name = os.fspath(dest) if isinstance(dest, (str, os.PathLike)) else ""
+    if fmt is None:
+        fmt = "parquet" if name.endswith(".parquet") else "csv"
+    if compress is None:
+        compress = name.endswith(".gz")
+
+    if fmt == "csv":
+        return _export_csv(dest, chunks, compress)
+    if fmt == "parquet":
+        return _export_parquet(dest, chunks)
+    raise ValueError(f"Unknown export format: {fmt!r}")
+
+
+def _first_rows(chunks: Iterator[list[tuple]],
+                max_rows: int) -> Iterator[list[tuple]]:
+    for chunk in chunks:
+        if max_rows <= 0:
+            return
+        yield chunk[:max_rows]
+        max_rows -= len(chunk)
+
+
+def _export_csv(dest, chunks: Iterator[list[tuple]], compress: bool) -> int:
+    wrapped = not compress and not isinstance(dest, (str, os.PathLike))
+    if compress:
+        stream = gzip.open(dest, "wt", encoding="utf-8", newline="")
+    elif wrapped:
+        stream = io.TextIOWrapper(dest, encoding="utf-8", newline="")
+    else:
+        stream = open(dest, "w", encoding="utf-8", newline="")
+    count = 0
+    try:
+        writer = csv.writer(stream)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            count += len(chunk)
+    finally:
+        if wrapped:
+            stream.flush()
+            stream.detach()     # leave the caller's file open
+        else:
+            stream.close()
+    return count
+
+
+def _export_parquet(dest, chunks: Iterator[list[tuple]]) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet export needs pyarrow: pip install pyarrow") from e
+
+    schema = pa.schema([("id", pa.int64())] +
+                       [(c, pa.string()) for c in EXPORT_COLUMNS[1:]])
+    count = 0
+    with pq.ParquetWriter(dest, schema) as writer:
+        for chunk in chunks:
+            # One row group per chunk
+            columns = list(zip(*chunk))
+            writer.write_table(pa.table(
+                {c: list(v) for c, v in zip(EXPORT_COLUMNS, columns)},
+                schema=schema))
+            count += len(chunk)
+    return count
+
+
+def save_stage_metrics(rows: list[dict]):
+    """Store a metrics.snapshot() in stage_metrics."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    with connect() as conn, conn:
+        conn.executemany("""
+            INSERT INTO stage_metrics
+                (recorded_at, stage, count, mean_ms, p50_ms, p95_ms, p99_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, [(now, r["stage"], r["count"], r["mean_ms"], r["p50_ms"],
+               r["p95_ms"], r["p99_ms"]) for r in rows])
 
 
 def fetch_session_stats() -> list[dict]:
     """Return per-session stats."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT session_id, started_at, message_count
-        FROM sessions ORDER BY started_at DESC LIMIT 100
-    """)
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+    with connect() as conn:
+        cur = conn.execute("""
+            SELECT session_id, started_at, message_count
+            FROM sessions ORDER BY started_at DESC LIMIT 100
+        """)
+        return [dict(r) for r in cur.fetchall()]
 
 
 def fetch_intent_stats() -> list[dict]:
-    """Return intent frequency counts."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("""
-        SELECT intent, COUNT(*) as count
-        FROM conversations
-        WHERE role = 'user' AND intent IS NOT NULL
-        GROUP BY intent ORDER BY count DESC
-    """)
-    rows = [dict(r) for r in cur.fetchall()]
-    conn.close()
-    return rows
+    """Return intent frequency counts (from the rollup_intents table)."""
+    with connect() as conn:
+        cur = conn.execute("""
+            SELECT intent, count
+            FROM rollup_intents
+            WHERE count > 0
+            ORDER BY count DESC
+        """)
+        return [dict(r) for r in cur.fetchall()]
 
 
 def fetch_total_stats() -> dict:
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("SELECT COUNT(*) FROM conversations")
-    total_msgs = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(DISTINCT session_id) FROM conversations")
-    total_sessions = cur.fetchone()[0]
-    cur.execute("SELECT COUNT(*) FROM conversations WHERE role = 'user'")
-    user_msgs = cur.fetchone()[0]
-    conn.close()
+    """Return message/session totals (from the rollup tables)."""
+    with connect() as conn:
+        roles = dict(conn.execute(
+            "SELECT role, count FROM rollup_roles").fetchall())
+        row = conn.execute(
+            "SELECT value FROM rollup_counters WHERE name = 'sessions'"
+        ).fetchone()
+    total_msgs = sum(roles.values())
+    total_sessions = row[0] if row else 0
+    user_msgs = roles.get("user", 0)
     return {
         "total_messages": total_msgs,
         "total_sessions": total_sessions,
@@ -118,9 +755,341 @@ def fetch_total_stats() -> dict:
 
 
 def clear_all_logs():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM conversations")
-    cur.execute("DELETE FROM sessions")
-    conn.commit()
-    conn.close()
+    """Delete every conversation and session and zero the rollups. The
+    delete trigger is dropped for the duration (DDL is transactional) so
+    SQLite can truncate the table instead of deleting row by row."""
+    flush_logs()
+    with connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DROP TRIGGER IF EXISTS trg_rollup_delete")
+            conn.execute("DELETE FROM conversations")
+            conn.execute("DELETE FROM sessions")
+            conn.execute("DELETE FROM rollup_roles")
+            conn.execute("DELETE FROM rollup_intents")
+            conn.execute("UPDATE rollup_counters SET value = 0 "
+                         "WHERE name = 'sessions'")
+            conn.execute(ROLLUP_DELETE_TRIGGER)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    _bump_generation()
+
+
+# ─────────────────────────────────────────────
+#  RETENTION  — archive, delete in small batches, vacuum
+# ─────────────────────────────────────────────
+# Rows read per archive pass; each pass appends one gzip member per day
+ARCHIVE_CHUNK_SIZE = 5000
+# Delete transactions are resized to stay under RETENTION_MAX_LOCK_MS.
+# After each one the job pauses at least as long as it held the lock, so
+# chat writers (polling in SQLite's busy handler) always get a turn.
+RETENTION_BATCH_SIZE = 100
+RETENTION_MIN_BATCH = 10
+RETENTION_MAX_LOCK_MS = 3.0
+RETENTION_MIN_PAUSE = 0.002
+VACUUM_PAGES_PER_STEP = 128
+RETENTION_INTERVAL = 3600       # seconds between background runs
+
+
+def _archive_dir() -> str:
+    return ARCHIVE_DIR or os.path.join(
+        os.path.dirname(os.path.abspath(DB_PATH)), "chat_archive")
+
+
+def _write_segments(archive_dir: str, rows: list[tuple]) -> list[str]:
+    """
+    Append rows to per-day segments (conversations-YYYY-MM-DD.jsonl.gz)
+    and fsync them. Each call adds one gzip member per day, which gzip
+    readers concatenate transparently.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    by_day: dict[str, list[tuple]] = {}
+    for row in rows:
+        by_day.setdefault(row[1][:10], []).append(row)
+    paths = []
+    for day, day_rows in by_day.items():
+        path = os.path.join(archive_dir, f"conversations-{day}.jsonl.gz")
+        with open(path, "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for row in day_rows:
+                    gz.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)),
+                                        ensure_ascii=False).encode("utf-8"))
+                    gz.write(b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        paths.append(path)
+    return paths
+
+
+def read_archive(path: str) -> Iterator[dict]:
+    """
+    Yield the rows of one archive segment. Archiving is at-least-once (a
+    crash between archiving and deleting a batch re-archives it on the
+    next run), so rows are de-duplicated by id.
+    """
+    seen = set()
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            row = json.loads(line)
+            if row["id"] not in seen:
+                seen.add(row["id"])
+                yield row
+
+
+def _delete_rows(conn: sqlite3.Connection, rows: list[tuple]) -> int:
+    """Delete (id, session_id, ...) rows and keep sessions consistent.
+    Returns the number of sessions left empty and removed."""
+    conn.executemany("DELETE FROM conversations WHERE id = ?",
+                     [(r[0],) for r in rows])
+    per_session = Counter(r[2] for r in rows)
+    conn.executemany("""
+        UPDATE sessions SET message_count = MAX(message_count - ?, 0)
+        WHERE session_id = ?
+    """, [(n, s) for s, n in per_session.items()])
+    cur = conn.executemany("""
+        DELETE FROM sessions WHERE session_id = ? AND NOT EXISTS (
+            SELECT 1 FROM conversations WHERE session_id = ?)
+    """, [(s, s) for s in per_session])
+    return cur.rowcount
+
+
+class _LockBudget:
+    """Resize batches so each write transaction stays under max_lock_ms."""
+
+    def __init__(self, batch_size: int, max_lock_ms: float):
+        self.batch_size = batch_size
+        self.max_lock_ms = max_lock_ms
+        self.longest_ms = 0.0
+
+    @contextmanager
+    def step(self):
+        start = time.perf_counter()
+        yield
+        ms = (time.perf_counter() - start) * 1000
+        self.longest_ms = max(self.longest_ms, ms)
+        if ms > self.max_lock_ms:
+            self.batch_size = max(RETENTION_MIN_BATCH, self.batch_size // 2)
+        elif ms < self.max_lock_ms / 2:
+            self.batch_size = min(RETENTION_BATCH_SIZE * 8, self.batch_size * 2)
+        time.sleep(max(RETENTION_MIN_PAUSE, ms / 1000))
+
+
+def run_retention(days: int | None = None, archive_dir: str | None = None,
+                  batch_size: int = RETENTION_BATCH_SIZE,
+                  max_lock_ms: float = RETENTION_MAX_LOCK_MS,
+                  vacuum: bool = True) -> dict:
+    """
+    Archive conversations older than `days` (default RETENTION_DAYS) to
+    per-day segment files, delete them, then reclaim the freed pages.
+    Every write transaction is kept around `max_lock_ms`, so concurrent
+    chat writes wait at most that long. Returns a summary dict.
+    """
+    days = RETENTION_DAYS if days is None else days
+    if days <= 0:
+        raise ValueError("Retention needs a positive number of days")
+    archive_dir = archive_dir or _archive_dir()
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    budget = _LockBudget(batch_size, max_lock_ms)
+    stats = {"cutoff": cutoff, "archive_dir": archive_dir, "archived": 0,
+             "sessions_removed": 0, "segments": set(), "pages_freed": 0}
+
+    last_id = 0
+    while True:
+        with connect() as conn:
+            rows = [tuple(r) for r in conn.execute(f"""
+                SELECT {', '.join(EXPORT_COLUMNS)} FROM conversations
+                WHERE timestamp < ? AND id > ? ORDER BY id LIMIT ?
+            """, (cutoff, last_id, ARCHIVE_CHUNK_SIZE)).fetchall()]
+        if not rows:
+            break
+        stats["segments"].update(_write_segments(archive_dir, rows))
+        done = 0
+        while done < len(rows):
+            batch = rows[done:done + budget.batch_size]
+            with budget.step(), connect() as conn, conn:
+                stats["sessions_removed"] += _delete_rows(conn, batch)
+            _bump_generation()
+            done += len(batch)
+        stats["archived"] += len(rows)
+        last_id = rows[-1][0]
+
+    longest_ms = budget.longest_ms
+    if vacuum:
+        budget = _LockBudget(VACUUM_PAGES_PER_STEP, max_lock_ms)
+        stats["pages_freed"] = incremental_vacuum(max_lock_ms, budget)
+        longest_ms = max(longest_ms, budget.longest_ms)
+    stats["segments"] = sorted(stats["segments"])
+    stats["longest_lock_ms"] = longest_ms
+    return stats
+
+
+def incremental_vacuum(max_lock_ms: float = RETENTION_MAX_LOCK_MS,
+                       budget: _LockBudget | None = None) -> int:
+    """
+    Return free pages to the filesystem a few at a time. Needs
+    auto_vacuum=INCREMENTAL (see enable_incremental_vacuum). Returns
+    the number of pages freed.
+    """
+    budget = budget or _LockBudget(VACUUM_PAGES_PER_STEP, max_lock_ms)
+    freed = 0
+    with connect() as conn:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            logger.info("auto_vacuum is not INCREMENTAL; run "
+                        "`python -m database enable-incremental-vacuum` once")
+            return 0
+        while True:
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                return freed
+            step = min(free, budget.batch_size)
+            with budget.step():
+                # execute() stops after the first page; a script runs it out
+                conn.executescript(f"PRAGMA incremental_vacuum({step});")
+            freed += free - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def enable_incremental_vacuum():
+    """
+    Switch an existing database to auto_vacuum=INCREMENTAL. This rewrites
+    the whole file with VACUUM and blocks writers while it runs, so do it
+    during maintenance; new databases start out incremental.
+    """
+    flush_logs()
+    with connect() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def repair_session_counts() -> int:
+    """Recompute sessions.message_count from conversations and drop
+    sessions with no messages left. Returns the rows changed."""
+    with connect() as conn, conn:
+        changed = conn.execute("""
+            UPDATE sessions SET message_count = (
+                SELECT COUNT(*) FROM conversations
+                WHERE conversations.session_id = sessions.session_id)
+            WHERE message_count != (
+                SELECT COUNT(*) FROM conversations
+                WHERE conversations.session_id = sessions.session_id)
+        """).rowcount
+        changed += conn.execute(
+            "DELETE FROM sessions WHERE message_count = 0").rowcount
+    _bump_generation()
+    return changed
+
+
+_retention_thread: threading.Thread | None = None
+_retention_stop = threading.Event()
+_retention_lock = threading.Lock()     # guards the two above
+
+
+def start_retention_worker(interval: float = RETENTION_INTERVAL,
+                           **kwargs) -> threading.Thread:
+    """Run run_retention(**kwargs) every `interval` seconds in a daemon
+    thread. Idempotent."""
+    global _retention_thread
+    with _retention_lock:
+        if _retention_thread is None or not _retention_thread.is_alive():
+            _retention_stop.clear()
+            _retention_thread = threading.Thread(
+                target=_retention_loop, args=(interval, kwargs),
+                name="Retention", daemon=True)
+            _retention_thread.start()
+        return _retention_thread
+
+
+def stop_retention_worker(timeout: float | None = None):
+    """Stop the retention thread. Joins under the lock, so a concurrent
+    start cannot clear the stop event while the old thread still runs."""
+    global _retention_thread
+    with _retention_lock:
+        _retention_stop.set()
+        if _retention_thread is not None:
+            _retention_thread.join(timeout)
+            _retention_thread = None
+
+
+def _retention_loop(interval: float, kwargs: dict):
+    while not _retention_stop.is_set():
+        try:
+            stats = run_retention(**kwargs)
+            if stats["archived"]:
+                logger.info("Retention archived %d rows (longest lock %.1f ms)",
+                            stats["archived"], stats["longest_lock_ms"])
+        except Exception:
+            logger.exception("Retention run failed")
+        _retention_stop.wait(interval)
+
+
+# ─────────────────────────────────────────────
+#  CLI  — python -m database <command>
+# ─────────────────────────────────────────────
+def main(argv: list[str] | None = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m database")
+    parser.add_argument("--db", help=f"database file (default: {DB_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="upgrade the schema in place")
+    commands.add_parser("rebuild-rollups",
+                        help="recompute the analytics rollup tables")
+    export = commands.add_parser("export", help="stream logs to CSV/Parquet")
+    export.add_argument("dest", help="output file (.csv, .csv.gz, .parquet)")
+    export.add_argument("--format", choices=["csv", "parquet"])
+    export.add_argument("--gzip", action="store_true", default=None)
+    export.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+    export.add_argument("--session")
+    export.add_argument("--intent")
+    export.add_argument("--role")
+    export.add_argument("--since")
+    retention = commands.add_parser(
+        "retention", help="archive and delete old conversations")
+    retention.add_argument("--days", type=int, default=RETENTION_DAYS or None,
+                           required=not RETENTION_DAYS,
+                           help="keep this many days (default: CHATBOT_RETENTION_DAYS)")
+    retention.add_argument("--archive-dir")
+    retention.add_argument("--max-lock-ms", type=float,
+                           default=RETENTION_MAX_LOCK_MS)
+    retention.add_argument("--no-vacuum", action="store_true")
+    commands.add_parser("enable-incremental-vacuum",
+                        help="one-off VACUUM switching to auto_vacuum=INCREMENTAL")
+    commands.add_parser("repair-session-counts",
+                        help="recompute sessions.message_count")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        configure(db_path=args.db)
+    if args.command == "migrate":
+        before = schema_version()
+        print(f"Schema version {before} -> {migrate()}")
+    elif args.command == "rebuild-rollups":
+        rebuild_rollups()
+        print(fetch_total_stats())
+    elif args.command == "export":
+        count = export_logs(
+            args.dest, fmt=args.format, compress=args.gzip,
+            chunk_size=args.chunk_size, session_id=args.session,
+            intent=args.intent, role=args.role, since=args.since,
+        )
+        print(f"Exported {count} rows to {args.dest}")
+    elif args.command == "retention":
+        stats = run_retention(args.days, args.archive_dir,
+                              max_lock_ms=args.max_lock_ms,
+                              vacuum=not args.no_vacuum)
+        print(f"Archived {stats['archived']} rows older than {stats['cutoff']} "
+              f"into {len(stats['segments'])} segments in {stats['archive_dir']}; "
+              f"{stats['sessions_removed']} sessions removed, "
+              f"{stats['pages_freed']} pages freed, "
+              f"longest lock {stats['longest_lock_ms']:.1f} ms")
+    elif args.command == "enable-incremental-vacuum":
+        enable_incremental_vacuum()
+        print("auto_vacuum = INCREMENTAL")
+    elif args.command == "repair-session-counts":
+        print(f"{repair_session_counts()} sessions repaired")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,361 @@
+"""
+Concurrent-session load test for the chat path and the logging layer.
+
+    python loadtest.py                                  # 50 sessions
+    python loadtest.py --sessions 10 50 100 200 400 --output load.json
+    python loadtest.py --mix "password=3,refund=1,noise=1" --readers 4
+    python loadtest.py --sessions 200 --busy-timeout-ms 100 --write-behind
+    python loadtest.py --sessions 50 200 --storage segments
+
+Each session is a thread with its own session_id that runs the Streamlit
+chat handler's turn (log_message user -> get_response -> log_message bot)
+while reader threads poll the dashboard queries. Every --sessions level
+runs against a fresh temporary database, so the sweep shows the point
+where SQLite write contention starts to dominate turn latency.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import chatbot_engine
+import database
+import storage
+from benchmarks import FILLER, NOISE, _git_commit, summarize
+
+# Message mix categories besides intent names; "all" spreads its weight
+# evenly over every intent in the knowledge base
+MIX_EXTRAS = ("all", "noise", "help", "empty")
+DEFAULT_MIX = "all=0.85,noise=0.11,help=0.02,empty=0.02"
+
+CALIBRATION_WRITES = 50
+
+
+# ─────────────────────────────────────────────
+#  MESSAGE MIX
+# ─────────────────────────────────────────────
+def parse_mix(spec: str) -> dict[str, float]:
+    """Parse "name=weight,..." into weights over intents and MIX_EXTRAS."""
+    intents = chatbot_engine.knowledge_base()
+    weights: dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in intents and name not in MIX_EXTRAS:
+            raise ValueError(f"unknown mix entry {name!r}; expected an intent "
+                             f"or one of {', '.join(MIX_EXTRAS)}")
+        try:
+            value = float(weight) if weight else 1.0
+        except ValueError:
+            raise ValueError(f"bad weight for {name!r}: {weight!r}")
+        if value < 0:
+            raise ValueError(f"negative weight for {name!r}")
+        if name == "all":
+            for intent in intents:
+                weights[intent] = weights.get(intent, 0.0) + value / len(intents)
+        else:
+            weights[name] = weights.get(name, 0.0) + value
+    if not any(weights.values()):
+        raise ValueError("message mix has no positive weights")
+    return weights
+
+
+def mix_messages(mix: dict[str, float], n: int, rng: random.Random) -> list[str]:
+    """Draw `n` messages: intent entries use that intent's patterns plus
+    filler words, the extras use noise words, help commands or blanks."""
+    kb = chatbot_engine.knowledge_base()
+    names, weights = list(mix), list(mix.values())
+    messages = []
+    for name in rng.choices(names, weights, k=n):
+        if name == "help":
+            messages.append(rng.choice(chatbot_engine.HELP_COMMANDS))
+        elif name == "empty":
+            messages.append(rng.choice(["", "   ", "?!", "..."]))
+        elif name == "noise":
+            messages.append(" ".join(rng.sample(NOISE, rng.randint(1, 4))))
+        else:
+            words = [rng.choice(kb[name]["patterns"])]
+            words += rng.sample(FILLER, rng.randint(0, 6))
+            rng.shuffle(words)
+            messages.append(" ".join(words).capitalize()
+                            + rng.choice(["", "?", "!", "."]))
+    return messages
+
+
+# ─────────────────────────────────────────────
+#  LOAD GENERATION
+# ─────────────────────────────────────────────
+def _is_locked(exc: sqlite3.OperationalError) -> bool:
+    text = str(exc).lower()
+    return "locked" in text or "busy" in text
+
+
+class Recorder:
+    """Latency samples and error counts shared by the worker threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples: dict[str, list[float]] = {}
+        self.locked_errors: dict[str, int] = {}
+        self.other_errors: dict[str, int] = {}
+
+    def record(self, step: str, seconds: float):
+        with self._lock:
+            self.samples.setdefault(step, []).append(seconds)
+
+    def error(self, step: str, exc: Exception):
+        locked = isinstance(exc, sqlite3.OperationalError) and _is_locked(exc)
+        counts = self.locked_errors if locked else self.other_errors
+        with self._lock:
+            counts[step] = counts.get(step, 0) + 1
+
+    def timed(self, step: str, fn, *args):
+        """Run fn(*args), recording its latency or its error. Returns
+        (ok, result)."""
+        start = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as exc:
+            self.error(step, exc)
+            return False, None
+        self.record(step, time.perf_counter() - start)
+        return True, result
+
+
+def run_session(store: storage.StorageBackend, session_id: str,
+                messages: list[str], think: float, recorder: Recorder,
+                start: threading.Barrier):
+    """One chat session: the same three steps as app.py's chat handler."""
+    start.wait()
+    for message in messages:
+        turn_start = time.perf_counter()
+        ok, _ = recorder.timed("log_user", store.log,
+                               session_id, "user", message)
+        if ok:
+            ok, result = recorder.timed("get_response",
+                                        chatbot_engine.get_response, message)
+        if ok:
+            ok, _ = recorder.timed(
+                "log_bot", store.log, session_id, "bot",
+                result["response"], result["intent"], result["confidence"])
+        if ok:
+            recorder.record("turn", time.perf_counter() - turn_start)
+        if think:
+            time.sleep(think * random.uniform(0.5, 1.5))
+
+
+def run_reader(store: storage.StorageBackend, interval: float,
+               recorder: Recorder, start: threading.Barrier,
+               stop: threading.Event):
+    """Poll the dashboard queries the Analytics and Logs views run."""
+    start.wait()
+    while not stop.is_set():
+        recorder.timed("fetch_total_stats", store.stats)
+        recorder.timed("fetch_intent_stats", store.intent_stats)
+        recorder.timed("fetch_logs_page", store.fetch)
+        if interval:
+            stop.wait(interval)
+
+
+def calibrate_write(store: storage.StorageBackend) -> float:
+    """Median uncontended log() latency on an empty store."""
+    latencies = []
+    for i in range(CALIBRATION_WRITES):
+        start = time.perf_counter()
+        store.log(f"calib{i % 5}", "user", "calibration")
+        latencies.append(time.perf_counter() - start)
+    store.clear()
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def _temp_store(name: str, workdir: str,
+                connections: int) -> storage.StorageBackend:
+    """A storage backend of the given kind, kept inside `workdir`."""
+    if name == "sqlite":
+        database.configure(pool_size=max(database.POOL_SIZE, connections))
+        # Write-behind starts after calibrate_write(), not on open()
+        return storage.SQLiteBackend(os.path.join(workdir, "load.db"),
+                                     write_behind=False, retention_days=0)
+    if name == "segments":
+        return storage.SegmentLogBackend(os.path.join(workdir, "segments"))
+    return storage.create_backend(name)
+
+
+def run_level(sessions: int, turns: int, mix: dict[str, float], readers: int,
+              think_ms: float, read_interval_ms: float, write_behind: bool,
+              seed: int = 0, storage_name: str = "sqlite") -> dict:
+    """Run `sessions` concurrent sessions of `turns` turns each against a
+    fresh temporary store and summarize what happened."""
+    workdir = tempfile.mkdtemp(prefix="chatbot-load-")
+    store = _temp_store(storage_name, workdir, sessions + readers)
+    try:
+        store.open()
+        baseline = calibrate_write(store)
+        if write_behind:
+            database.start_log_writer()
+
+        rng = random.Random(seed)
+        scripts = [mix_messages(mix, turns, rng) for _ in range(sessions)]
+        recorder = Recorder()
+        start = threading.Barrier(sessions + readers + 1)
+        stop = threading.Event()
+        threads = [
+            threading.Thread(target=run_session, name=f"session-{i}",
+                             args=(store, f"load{i:05d}", script,
+                                   think_ms / 1000, recorder, start),
+                             daemon=True)
+            for i, script in enumerate(scripts)]
+        threads += [
+            threading.Thread(target=run_reader, name=f"reader-{i}",
+                             args=(store, read_interval_ms / 1000, recorder,
+                                   start, stop), daemon=True)
+            for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        began = time.perf_counter()
+        for thread in threads[:sessions]:
+            thread.join()
+        store.flush()
+        elapsed = time.perf_counter() - began
+        stop.set()
+        for thread in threads[sessions:]:
+            thread.join()
+        return _report(recorder, sessions, readers, elapsed, baseline,
+                       storage_name == "sqlite" and not write_behind)
+    finally:
+        store.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _report(recorder: Recorder, sessions: int, readers: int, elapsed: float,
+            baseline: float, measure_busy_wait: bool) -> dict:
+    samples = recorder.samples
+    turns = len(samples.get("turn", []))
+    reads = len(samples.get("fetch_total_stats", []))
+    writes = samples.get("log_user", []) + samples.get("log_bot", [])
+    # SQLite's busy handler sleeps inside the call, so time a write spends
+    # above its uncontended median is counted as busy wait (this also
+    # absorbs GIL and scheduler delay, so read it as an upper bound).
+    # With --write-behind the calls only enqueue, and the other backends
+    # have no busy handler, so it is only reported for inline SQLite.
+    busy_wait = (sum(max(0.0, w - baseline) for w in writes)
+                 if measure_busy_wait else None)
+    return {
+        "sessions": sessions,
+        "readers": readers,
+        "elapsed_sec": elapsed,
+        "turns": turns,
+        "turns_per_sec": turns / elapsed if elapsed else None,
+        "dashboard_reads_per_sec": reads / elapsed if elapsed else None,
+        "locked_errors": sum(recorder.locked_errors.values()),
+        "locked_errors_by_step": recorder.locked_errors,
+        "other_errors": recorder.other_errors,
+        "uncontended_write_ms": baseline * 1000,
+        "busy_wait_sec": busy_wait,
+        "busy_wait_ms_per_write": (busy_wait / len(writes) * 1000
+                                   if busy_wait is not None and writes else None),
+        "steps": {step: summarize(values) for step, values in samples.items()},
+    }
+
+
+# ─────────────────────────────────────────────
+#  CLI
+# ─────────────────────────────────────────────
+def _table(levels: list[dict]) -> str:
+    lines = [f"{'sessions':>8} {'turns/s':>9} {'turn p50':>9} {'turn p99':>9} "
+             f"{'write p99':>9} {'locked':>7} {'busy wait':>10}"]
+    for level in levels:
+        steps = level["steps"]
+        turn = steps.get("turn", {})
+        write = steps.get("log_bot", {})
+        busy = level["busy_wait_sec"]
+        lines.append(
+            f"{level['sessions']:>8} {level['turns_per_sec'] or 0:>9.1f} "
+            f"{turn.get('p50_ms', 0):>7.1f}ms {turn.get('p99_ms', 0):>7.1f}ms "
+            f"{write.get('p99_ms', 0):>7.1f}ms {level['locked_errors']:>7} "
+            + (f"{busy:>9.2f}s" if busy is not None else f"{'n/a':>10}"))
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50],
+                        help="concurrent session counts to run, one level each")
+    parser.add_argument("--turns", type=int, default=20,
+                        help="chat turns per session")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help="message mix as name=weight,... where name is an "
+                             "intent or one of " + ", ".join(MIX_EXTRAS))
+    parser.add_argument("--readers", type=int, default=2,
+                        help="dashboard reader threads")
+    parser.add_argument("--think-ms", type=float, default=0,
+                        help="mean pause between a session's turns")
+    parser.add_argument("--read-interval-ms", type=float, default=100,
+                        help="pause between a reader's dashboard refreshes")
+    parser.add_argument("--busy-timeout-ms", type=int,
+                        help=f"override SQLite busy_timeout "
+                             f"(default {database.PRAGMAS['busy_timeout']})")
+    parser.add_argument("--write-behind", action="store_true",
+                        help="log through the background LogWriter (sqlite)")
+    parser.add_argument("--storage", choices=list(storage.BACKENDS),
+                        default="sqlite", help="log backend to drive")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write JSON results here")
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.write_behind and args.storage != "sqlite":
+        parser.error("--write-behind only applies to --storage sqlite")
+    if args.busy_timeout_ms is not None:
+        database.PRAGMAS["busy_timeout"] = args.busy_timeout_ms
+
+    warmup = chatbot_engine.get_engine().warm_up()
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "turns": args.turns,
+            "mix": mix,
+            "busy_timeout_ms": database.PRAGMAS["busy_timeout"],
+            "write_behind": args.write_behind,
+            "storage": args.storage,
+            "engine_warmup_sec": warmup,
+        },
+        "levels": [],
+    }
+    for sessions in args.sessions:
+        chatbot_engine.clear_caches()
+        level = run_level(sessions, args.turns, mix, args.readers,
+                          args.think_ms, args.read_interval_ms,
+                          args.write_behind, args.seed, args.storage)
+        level["reply_cache"] = chatbot_engine.cache_stats()["result"]
+        results["levels"].append(level)
+        print(f"{sessions} sessions: {level['turns_per_sec']:.1f} turns/s, "
+              f"{level['locked_errors']} locked errors", file=sys.stderr)
+
+    print(_table(results["levels"]), file=sys.stderr)
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+In-process latency histograms for the chat pipeline.
+
+    with metrics.timed("score"):
+        ...
+    metrics.snapshot()   # [{ "stage", "count", "p50_ms", ... }, ...]
+
+Each stage keeps its last RESERVOIR_SIZE samples, so percentiles track
+recent traffic and memory stays constant.
+"""
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+RESERVOIR_SIZE = 2048
+
+# Pipeline stages in display order; unknown stages sort after these
+STAGES = ["tokenize", "lemmatize", "preprocess", "fuzzy", "score", "respond",
+          "log_user", "log_bot", "turn"]
+
+
+class Histogram:
+    """Recent latency samples (seconds) plus lifetime count and total."""
+
+    def __init__(self, size: int = RESERVOIR_SIZE):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def summary(self) -> dict:
+        with self._lock:
+            ordered = sorted(self._samples)
+            count, total = self.count, self.total
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+        return {
+            "count": count,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+
+_histograms: dict[str, Histogram] = {}
+_lock = threading.Lock()
+
+
+def record(stage: str, seconds: float):
+    hist = _histograms.get(stage)
+    if hist is None:
+        with _lock:
+            hist = _histograms.setdefault(stage, Histogram())
+    hist.record(seconds)
+
+
+@contextmanager
+def timed(stage: str):
+    """Record the duration of the `with` block under `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def snapshot() -> list[dict]:
+    """Return one summary dict per stage, in pipeline order."""
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    stages = sorted(_histograms, key=lambda s: (order.get(s, len(order)), s))
+    return [{"stage": s, **_histograms[s].summary()} for s in stages]
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def persist() -> int:
+    """Append the current snapshot to the stage_metrics table."""
+    import database
+
+    rows = snapshot()
+    database.save_stage_metrics(rows)
+    return len(rows)
+
+
+def process_memory() -> dict:
+    """Resident and peak resident memory of this process, in MB. Current
+    RSS needs /proc (Linux); elsewhere only the peak is reported."""
+    rss_mb = peak_mb = None
+    try:
+        with open("/proc/self/statm") as fh:
+            rss_mb = int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:     # Windows
+        pass
+    else:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        peak_mb = peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+    return {"pid": os.getpid(), "rss_mb": rss_mb, "peak_rss_mb": peak_mb}
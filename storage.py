@@ -0,0 +1,609 @@
+"""
+Pluggable storage for conversation logs.
+
+    store = storage.get_backend()       # picked by CHATBOT_STORAGE
+    store.log(session_id, "user", "hello")
+    store.fetch(limit=50, role="user")  # newest first, keyset on id
+    store.stats(); store.intent_stats()
+    store.export("logs.csv.gz")
+    store.clear()
+
+Backends:
+    sqlite    — database.py (default): WAL SQLite with rollup tables,
+                optional write-behind and retention
+    memory    — process-local lists, for tests and benchmarks
+    segments  — append-only JSONL segments with a binary sidecar index,
+                for very high write rates from a single writer process
+
+Rows are (id, timestamp, session_id, role, message, intent, confidence)
+tuples in database.EXPORT_COLUMNS order; fetch() returns them as dicts.
+"""
+import glob
+import json
+import os
+import struct
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Protocol, runtime_checkable
+
+import database
+from database import EXPORT_COLUMNS, EXPORT_CHUNK_SIZE
+
+STORAGE_BACKEND = os.environ.get("CHATBOT_STORAGE", "sqlite")
+
+# Segment log: directory (default chat_segments/ next to the database),
+# size at which the active segment is sealed, and whether every write is
+# fsynced (otherwise it is flushed to the OS, which survives an app crash
+# but not a power cut)
+SEGMENT_DIR = os.environ.get("CHATBOT_SEGMENT_DIR")
+SEGMENT_MAX_BYTES = int(os.environ.get("CHATBOT_SEGMENT_MAX_MB", "64")) << 20
+SEGMENT_FSYNC = os.environ.get("CHATBOT_SEGMENT_FSYNC", "0") == "1"
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """What the app needs from a conversation log store."""
+
+    name: str
+
+    def open(self) -> None: ...
+
+    def close(self) -> None: ...
+
+    def log(self, session_id: str, role: str, message: str,
+            intent: str | None = None, confidence: str | None = None) -> None: ...
+
+    def flush(self, timeout: float | None = None) -> bool: ...
+
+    def fetch(self, after_id: int | None = None, limit: int = 100,
+              session_id: str | None = None, intent: str | None = None,
+              role: str | None = None, since: str | None = None) -> list[dict]: ...
+
+    def stats(self) -> dict: ...
+
+    def intent_stats(self) -> list[dict]: ...
+
+    def iter_chunks(self, chunk_size: int = EXPORT_CHUNK_SIZE,
+                    newest_first: bool = False,
+                    **filters) -> Iterator[list[tuple]]: ...
+
+    def export(self, dest, fmt: str | None = None, compress: bool | None = None,
+               chunk_size: int = EXPORT_CHUNK_SIZE, max_rows: int | None = None,
+               newest_first: bool = False, **filters) -> int: ...
+
+    def clear(self) -> None: ...
+
+    def generation(self) -> int: ...
+
+
+# ─────────────────────────────────────────────
+#  SQLITE  — the existing database module
+# ─────────────────────────────────────────────
+class SQLiteBackend:
+    """database.py behind the StorageBackend interface. `path` defaults
+    to database.DB_PATH; write-behind and retention default to their
+    CHATBOT_* settings."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str | None = None, write_behind: bool | None = None,
+                 retention_days: int | None = None):
+        self.path = path
+        self.write_behind = (database.WRITE_BEHIND if write_behind is None
+                             else write_behind)
+        self.retention_days = (database.RETENTION_DAYS if retention_days is None
+                               else retention_days)
+
+    def open(self):
+        if self.path is not None:
+            database.configure(db_path=self.path)
+        database.init_db()
+        if self.write_behind:
+            database.start_log_writer()
+        if self.retention_days:
+            database.start_retention_worker(days=self.retention_days)
+
+    def close(self):
+        database.stop_retention_worker()
+        database.stop_log_writer()
+        database.close_connections()
+
+    def log(self, session_id, role, message, intent=None, confidence=None):
+        database.log_message(session_id, role, message, intent, confidence)
+
+    def flush(self, timeout=None):
+        return database.flush_logs(timeout)
+
+    def fetch(self, after_id=None, limit=100, session_id=None, intent=None,
+              role=None, since=None):
+        return database.fetch_logs_page(after_id, limit, session_id=session_id,
+                                        intent=intent, role=role, since=since)
+
+    def stats(self):
+        return database.fetch_total_stats()
+
+    def intent_stats(self):
+        return database.fetch_intent_stats()
+
+    def iter_chunks(self, chunk_size=EXPORT_CHUNK_SIZE, newest_first=False,
+                    **filters):
+        return database.iter_log_chunks(chunk_size, newest_first, **filters)
+
+    def export(self, dest, fmt=None, compress=None,
+               chunk_size=EXPORT_CHUNK_SIZE, max_rows=None, newest_first=False,
+               **filters):
+        return database.export_logs(dest, fmt, compress, chunk_size, max_rows,
+                                    newest_first, **filters)
+
+    def clear(self):
+        database.clear_all_logs()
+
+    def generation(self):
+        return database.write_generation()
+
+
+# ─────────────────────────────────────────────
+#  SHARED PARTS OF THE NON-SQL BACKENDS
+# ─────────────────────────────────────────────
+def _matches(row: tuple, session_id: str | None = None,
+             intent: str | None = None, role: str | None = None,
+             since: str | None = None) -> bool:
+    """The filters of database._log_filters, applied to one row."""
+    return ((session_id is None or row[2] == session_id)
+            and (intent is None or row[5] == intent)
+            and (role is None or row[3] == role)
+            and (since is None or row[1] >= str(since)))
+
+
+class _Rollups:
+    """Running totals behind stats() and intent_stats(), counted the way
+    the SQLite rollup triggers count them."""
+
+    def __init__(self):
+        self.roles: Counter = Counter()
+        self.intents: Counter = Counter()
+        self.sessions: set[str] = set()
+
+    def add(self, row: tuple):
+        self.roles[row[3]] += 1
+        if row[3] == "user" and row[5] is not None:
+            self.intents[row[5]] += 1
+        self.sessions.add(row[2])
+
+    def merge(self, other: "_Rollups"):
+        self.roles.update(other.roles)
+        self.intents.update(other.intents)
+        self.sessions |= other.sessions
+
+    def stats(self) -> dict:
+        total = sum(self.roles.values())
+        user = self.roles.get("user", 0)
+        return {
+            "total_messages": total,
+            "total_sessions": len(self.sessions),
+            "user_messages": user,
+            "bot_messages": total - user,
+        }
+
+    def intent_stats(self) -> list[dict]:
+        return [{"intent": intent, "count": count}
+                for intent, count in self.intents.most_common() if count > 0]
+
+    def to_json(self) -> dict:
+        return {"roles": self.roles, "intents": self.intents,
+                "sessions": sorted(self.sessions)}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "_Rollups":
+        rollups = cls()
+        rollups.roles.update(data["roles"])
+        rollups.intents.update(data["intents"])
+        rollups.sessions.update(data["sessions"])
+        return rollups
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _chunked(rows: Iterator[tuple], chunk_size: int) -> Iterator[list[tuple]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _newest_chunks(fetch, chunk_size: int, **filters) -> Iterator[list[tuple]]:
+    """Rows newest first, chunk by chunk, from keyset fetch() pages."""
+    after_id = None
+    while True:
+        page = fetch(after_id, chunk_size, **filters)
+        if not page:
+            return
+        yield [tuple(row[column] for column in EXPORT_COLUMNS) for row in page]
+        after_id = page[-1]["id"]
+
+
+class _RowStore:
+    """Locking, rollups, the write generation and export for backends
+    that keep rows themselves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rollups = _Rollups()
+        self._generation = 0
+
+    def flush(self, timeout=None):
+        return True
+
+    def stats(self):
+        with self._lock:
+            return self._rollups.stats()
+
+    def intent_stats(self):
+        with self._lock:
+            return self._rollups.intent_stats()
+
+    def generation(self):
+        return self._generation
+
+    def export(self, dest, fmt=None, compress=None,
+               chunk_size=EXPORT_CHUNK_SIZE, max_rows=None, newest_first=False,
+               **filters):
+        return database.write_export(
+            dest, self.iter_chunks(chunk_size, newest_first, **filters), fmt,
+            compress, max_rows)
+
+
+# ─────────────────────────────────────────────
+#  IN-MEMORY
+# ─────────────────────────────────────────────
+class MemoryBackend(_RowStore):
+    """Rows in a list, gone when the process exits. Ids keep increasing
+    across clear(), as with AUTOINCREMENT."""
+
+    name = "memory"
+
+    def __init__(self):
+        super().__init__()
+        self._rows: list[tuple] = []
+        self._next_id = 1
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def log(self, session_id, role, message, intent=None, confidence=None):
+        with self._lock:
+            row = (self._next_id, _now(), session_id, role, message,
+                   intent, confidence)
+            self._rows.append(row)
+            self._rollups.add(row)
+            self._next_id += 1
+            self._generation += 1
+
+    def fetch(self, after_id=None, limit=100, session_id=None, intent=None,
+              role=None, since=None):
+        with self._lock:
+            rows = self._rows
+            # Ids are contiguous, so after_id maps straight to a position
+            end = len(rows)
+            if after_id is not None and rows:
+                end = max(0, min(end, after_id - rows[0][0]))
+            page = []
+            for i in range(end - 1, -1, -1):
+                if len(page) >= limit:
+                    break
+                if _matches(rows[i], session_id, intent, role, since):
+                    page.append(dict(zip(EXPORT_COLUMNS, rows[i])))
+            return page
+
+    def iter_chunks(self, chunk_size=EXPORT_CHUNK_SIZE, newest_first=False,
+                    **filters):
+        if newest_first:
+            return _newest_chunks(self.fetch, chunk_size, **filters)
+        with self._lock:
+            rows = list(self._rows)
+        return _chunked((r for r in rows if _matches(r, **filters)), chunk_size)
+
+    def clear(self):
+        with self._lock:
+            self._rows = []
+            self._rollups = _Rollups()
+            self._generation += 1
+
+
+# ─────────────────────────────────────────────
+#  SEGMENTED APPEND-ONLY LOG
+# ─────────────────────────────────────────────
+_OFFSET = struct.Struct("<Q")
+
+
+class _Segment:
+    """One segment-<first id>.jsonl file, its .idx sidecar (the byte
+    offset of every record, 8 bytes each, so record k is at idx[8k]) and,
+    once sealed, a .json sidecar with its rollups."""
+
+    def __init__(self, directory: str, first_id: int):
+        self.first_id = first_id
+        stem = os.path.join(directory, f"segment-{first_id:012d}")
+        self.data_path = stem + ".jsonl"
+        self.index_path = stem + ".idx"
+        self.summary_path = stem + ".json"
+        self.count = 0
+        self.size = 0
+
+    def paths(self) -> list[str]:
+        return [self.data_path, self.index_path, self.summary_path]
+
+    def read(self, start: int, stop: int) -> list[tuple]:
+        """Records start..stop-1 (positions within the segment). Only the
+        first `count` records, `size` bytes, are ever read, so records
+        being appended concurrently are never seen half-written."""
+        if start >= stop:
+            return []
+        with open(self.index_path, "rb") as fh:
+            fh.seek(start * _OFFSET.size)
+            begin = _OFFSET.unpack(fh.read(_OFFSET.size))[0]
+            if stop < self.count:
+                fh.seek(stop * _OFFSET.size)
+                end = _OFFSET.unpack(fh.read(_OFFSET.size))[0]
+            else:
+                end = self.size
+        with open(self.data_path, "rb") as fh:
+            fh.seek(begin)
+            blob = fh.read(end - begin)
+        return [_decode(line) for line in blob.splitlines()]
+
+
+def _encode(row: tuple) -> bytes:
+    return json.dumps(dict(zip(EXPORT_COLUMNS, row)),
+                      ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+def _decode(line: bytes) -> tuple:
+    record = json.loads(line)
+    return tuple(record[c] for c in EXPORT_COLUMNS)
+
+
+class SegmentLogBackend(_RowStore):
+    """
+    Append-only log for very high write rates. Each log() appends one
+    JSON line to the active segment and its offset to the .idx sidecar:
+    no transaction, no fsync (unless CHATBOT_SEGMENT_FSYNC=1), no lock
+    shared with other processes. Once a segment reaches `max_bytes` it is
+    sealed: fsynced, with its rollups written to a .json sidecar, so
+    open() only re-reads the active segment.
+
+    Reads use the index to seek straight to a keyset cursor; filtered
+    reads scan backwards from there. Only one process may write a given
+    directory at a time.
+    """
+
+    name = "segments"
+
+    def __init__(self, directory: str | None = None,
+                 max_bytes: int = SEGMENT_MAX_BYTES, fsync: bool = SEGMENT_FSYNC):
+        super().__init__()
+        self.directory = directory or SEGMENT_DIR or os.path.join(
+            os.path.dirname(os.path.abspath(database.DB_PATH)), "chat_segments")
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._segments: list[_Segment] = []
+        self._active_rollups = _Rollups()
+        self._data = self._index = None
+
+    # ── lifecycle ──
+    def open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            firsts = sorted(
+                int(os.path.basename(p)[len("segment-"):-len(".jsonl")])
+                for p in glob.glob(os.path.join(self.directory, "segment-*.jsonl")))
+            self._segments = [_Segment(self.directory, f) for f in firsts]
+            self._rollups = _Rollups()
+            for segment in self._segments[:-1]:
+                self._rollups.merge(self._load_sealed(segment))
+            if self._segments:
+                self._active_rollups = self._recover(self._segments[-1])
+                self._rollups.merge(self._active_rollups)
+                self._open_active()
+            else:
+                self._start_segment(1)
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    def _load_sealed(self, segment: _Segment) -> _Rollups:
+        segment.size = os.path.getsize(segment.data_path)
+        segment.count = os.path.getsize(segment.index_path) // _OFFSET.size
+        try:
+            with open(segment.summary_path, encoding="utf-8") as fh:
+                return _Rollups.from_json(json.load(fh))
+        except (OSError, ValueError, KeyError):
+            rollups = _Rollups()
+            for row in segment.read(0, segment.count):
+                rollups.add(row)
+            self._write_summary(segment, rollups)
+            return rollups
+
+    def _recover(self, segment: _Segment) -> _Rollups:
+        """Drop a torn last line from the active segment and rebuild its
+        index, which may be behind the data after a crash."""
+        with open(segment.data_path, "rb") as fh:
+            blob = fh.read()
+        complete = blob[:blob.rfind(b"\n") + 1]
+        if len(complete) != len(blob):
+            with open(segment.data_path, "r+b") as fh:
+                fh.truncate(len(complete))
+        rollups = _Rollups()
+        offsets = bytearray()
+        offset = 0
+        for line in complete.splitlines(keepends=True):
+            rollups.add(_decode(line))
+            offsets += _OFFSET.pack(offset)
+            offset += len(line)
+        with open(segment.index_path, "wb") as fh:
+            fh.write(offsets)
+        segment.size = len(complete)
+        segment.count = len(offsets) // _OFFSET.size
+        return rollups
+
+    def _open_active(self):
+        segment = self._segments[-1]
+        self._data = open(segment.data_path, "ab")
+        self._index = open(segment.index_path, "ab")
+
+    def _close_active(self):
+        for fh in (self._data, self._index):
+            if fh is not None:
+                fh.flush()
+                os.fsync(fh.fileno())
+                fh.close()
+        self._data = self._index = None
+
+    def _start_segment(self, first_id: int):
+        self._segments.append(_Segment(self.directory, first_id))
+        self._active_rollups = _Rollups()
+        self._open_active()
+
+    def _write_summary(self, segment: _Segment, rollups: _Rollups):
+        tmp = segment.summary_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(rollups.to_json(), fh)
+        os.replace(tmp, segment.summary_path)
+
+    def _seal(self):
+        segment = self._segments[-1]
+        self._close_active()
+        self._write_summary(segment, self._active_rollups)
+        self._start_segment(segment.first_id + segment.count)
+
+    # ── writes ──
+    def log(self, session_id, role, message, intent=None, confidence=None):
+        with self._lock:
+            segment = self._segments[-1]
+            row = (segment.first_id + segment.count, _now(), session_id, role,
+                   message, intent, confidence)
+            line = _encode(row)
+            self._data.write(line)
+            self._index.write(_OFFSET.pack(segment.size))
+            self._data.flush()
+            self._index.flush()
+            if self.fsync:
+                os.fsync(self._data.fileno())
+                os.fsync(self._index.fileno())
+            segment.size += len(line)
+            segment.count += 1
+            self._rollups.add(row)
+            self._active_rollups.add(row)
+            self._generation += 1
+            if segment.size >= self.max_bytes:
+                self._seal()
+
+    def clear(self):
+        with self._lock:
+            next_id = self._segments[-1].first_id + self._segments[-1].count
+            self._close_active()
+            for segment in self._segments:
+                for path in segment.paths():
+                    if os.path.exists(path):
+                        os.remove(path)
+            self._segments = []
+            self._rollups = _Rollups()
+            self._start_segment(next_id)
+            self._generation += 1
+
+    # ── reads ──
+    def _snapshot(self) -> list[_Segment]:
+        """Copies of the segments as they are now; later appends to the
+        active one are outside the copy's count and size."""
+        with self._lock:
+            copies = []
+            for segment in self._segments:
+                copy = _Segment(self.directory, segment.first_id)
+                copy.count, copy.size = segment.count, segment.size
+                copies.append(copy)
+            return copies
+
+    def fetch(self, after_id=None, limit=100, session_id=None, intent=None,
+              role=None, since=None):
+        page = []
+        block = max(limit, 256)
+        for segment in reversed(self._snapshot()):
+            stop = segment.count
+            if after_id is not None:
+                stop = min(stop, after_id - segment.first_id)
+            while stop > 0 and len(page) < limit:
+                start = max(0, stop - block)
+                try:
+                    rows = segment.read(start, stop)
+                except FileNotFoundError:     # cleared while reading
+                    return page
+                for row in reversed(rows):
+                    if _matches(row, session_id, intent, role, since):
+                        page.append(dict(zip(EXPORT_COLUMNS, row)))
+                        if len(page) >= limit:
+                            break
+                stop = start
+            if len(page) >= limit:
+                break
+        return page
+
+    def iter_chunks(self, chunk_size=EXPORT_CHUNK_SIZE, newest_first=False,
+                    **filters):
+        if newest_first:
+            return _newest_chunks(self.fetch, chunk_size, **filters)
+
+        def rows():
+            for segment in self._snapshot():
+                for start in range(0, segment.count, chunk_size):
+                    for row in segment.read(
+                            start, min(segment.count, start + chunk_size)):
+                        if _matches(row, **filters):
+                            yield row
+        return _chunked(rows(), chunk_size)
+
+
+# ─────────────────────────────────────────────
+#  CONFIGURATION
+# ─────────────────────────────────────────────
+BACKENDS = {
+    "sqlite": SQLiteBackend,
+    "memory": MemoryBackend,
+    "segments": SegmentLogBackend,
+}
+
+_backend: StorageBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def create_backend(name: str | None = None, **options) -> StorageBackend:
+    """Build (but do not open) a backend by name; default CHATBOT_STORAGE."""
+    name = name or STORAGE_BACKEND
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend {name!r}; expected one "
+                         f"of {', '.join(BACKENDS)}") from None
+    return cls(**options)
+
+
+def get_backend() -> StorageBackend:
+    """This process's configured backend, opened on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend = create_backend()
+            backend.open()
+            _backend = backend
+        return _backend
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    """database.py pointed at a fresh, migrated temp file."""
+    old = database.DB_PATH
+    database.configure(db_path=str(tmp_path / "chat.db"))
+    database.init_db()
+    yield database.DB_PATH
+    database.stop_log_writer()
+    database.stop_retention_worker()
+    database.configure(db_path=old)
+
+
+@pytest.fixture(params=["memory", "sqlite", "segments"])
+def store(request, tmp_path):
+    """An opened backend of each kind, kept inside tmp_path."""
+    old = database.DB_PATH
+    if request.param == "sqlite":
+        backend = storage.SQLiteBackend(str(tmp_path / "chat.db"),
+                                        write_behind=False, retention_days=0)
+    elif request.param == "segments":
+        backend = storage.SegmentLogBackend(str(tmp_path / "segments"))
+    else:
+        backend = storage.MemoryBackend()
+    backend.open()
+    yield backend
+    backend.close()
+    database.configure(db_path=old)
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+
+import database
+
+
+def insert(rows):
+    """(session_id, timestamp, role, message, intent, confidence) rows."""
+    with database.connect() as conn, conn:
+        database._insert_records(conn, rows)
+
+
+def rollups():
+    with database.connect() as conn:
+        roles = dict(conn.execute("SELECT role, count FROM rollup_roles"))
+        intents = dict(conn.execute(
+            "SELECT intent, count FROM rollup_intents WHERE count > 0"))
+    return roles, intents, database.fetch_total_stats()["total_sessions"]
+
+
+def test_migrate_is_idempotent(sqlite_db):
+    assert database.schema_version() == database.SCHEMA_VERSION
+    assert database.migrate() == database.SCHEMA_VERSION
+
+
+def test_migrate_adopts_pre_migration_database(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT NOT NULL,
+            timestamp TEXT NOT NULL, role TEXT NOT NULL,
+            message TEXT NOT NULL, intent TEXT, confidence TEXT);
+        CREATE TABLE sessions (
+            session_id TEXT PRIMARY KEY, started_at TEXT NOT NULL,
+            message_count INTEGER DEFAULT 0);
+        INSERT INTO conversations (session_id, timestamp, role, message, intent)
+        VALUES ('a', '2024-01-01 00:00:00', 'user', 'hi', 'greetings'),
+               ('a', '2024-01-01 00:00:01', 'bot', 'hello', 'greetings'),
+               ('b', '2024-01-01 00:00:02', 'user', 'refund?', 'refund');
+    """)
+    conn.close()
+
+    old = database.DB_PATH
+    database.configure(db_path=path)
+    try:
+        assert database.schema_version() == 0
+        assert database.migrate() == database.SCHEMA_VERSION
+        # v3 builds the rollups from the rows already there
+        assert rollups() == ({"user": 2, "bot": 1},
+                             {"greetings": 1, "refund": 1}, 2)
+    finally:
+        database.configure(db_path=old)
+
+
+def test_rollup_triggers_track_inserts_and_deletes(sqlite_db):
+    insert([("a", "2024-01-01 00:00:00", "user", "hi", "greetings", "high"),
+            ("a", "2024-01-01 00:00:01", "bot", "hello", "greetings", "high"),
+            ("b", "2024-01-01 00:00:02", "user", "refund", "refund", "high")])
+    assert rollups() == ({"user": 2, "bot": 1}, {"greetings": 1, "refund": 1}, 2)
+
+    with database.connect() as conn, conn:
+        conn.execute("DELETE FROM conversations WHERE session_id = 'b'")
+    assert rollups() == ({"user": 1, "bot": 1}, {"greetings": 1}, 1)
+
+    before = rollups()
+    database.rebuild_rollups()
+    assert rollups() == before
+
+
+def test_clear_all_logs_zeroes_rollups_and_keeps_delete_trigger(sqlite_db):
+    for i in range(50):
+        database.log_message(f"s{i % 5}", "user", "hi", "greetings", "high")
+    database.clear_all_logs()
+    assert database.fetch_total_stats() == {
+        "total_messages": 0, "total_sessions": 0,
+        "user_messages": 0, "bot_messages": 0}
+    assert database.fetch_intent_stats() == []
+
+    database.log_message("x", "user", "hi", "greetings", "high")
+    with database.connect() as conn, conn:
+        conn.execute("DELETE FROM conversations")
+    assert database.fetch_total_stats()["total_messages"] == 0
+    assert database.fetch_total_stats()["total_sessions"] == 0
+
+
+def test_log_writer_flushes_and_survives_a_bad_record(sqlite_db):
+    writer = database.start_log_writer()
+    for i in range(20):
+        database.log_message("s", "user", f"m{i}")
+    database.log_message("s", "user", None)     # violates NOT NULL
+    assert database.flush_logs(5)
+    stats = writer.stats()
+    assert stats["written"] == 20
+    assert stats["failed"] == 1
+    database.stop_log_writer()
+    assert database.fetch_total_stats()["total_messages"] == 20
+
+
+def test_retention_archives_and_deletes_old_rows(sqlite_db, tmp_path):
+    insert([("old", "2000-01-01 00:00:00", "user", "ancient", "refund", "high"),
+            ("old", "2000-01-01 00:00:01", "bot", "reply", "refund", "high")])
+    database.log_message("new", "user", "recent", "refund", "high")
+
+    archive = str(tmp_path / "archive")
+    stats = database.run_retention(days=30, archive_dir=archive)
+    assert stats["archived"] == 2
+    assert stats["sessions_removed"] == 1
+    assert [r["message"] for r in database.fetch_logs_page()] == ["recent"]
+    assert database.fetch_total_stats()["total_sessions"] == 1
+
+    archived = [row for path in stats["segments"]
+                for row in database.read_archive(path)]
+    assert sorted(r["message"] for r in archived) == ["ancient", "reply"]
+    assert all(os.path.dirname(p) == archive for p in stats["segments"])
+
+
+def test_retention_worker_start_stop_is_race_free(sqlite_db):
+    def cycle():
+        database.start_retention_worker(interval=0.01, days=30)
+        database.stop_retention_worker()
+
+    threads = [threading.Thread(target=cycle) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not any(t.name == "Retention" for t in threading.enumerate())
@@ -0,0 +1,105 @@
+import pytest
+
+import chatbot_engine as ce
+
+SOURCE = {
+    "intents": {
+        "shipping": {"patterns": ["shipping", "order"], "responses": ["s"]},
+        "password": {"patterns": ["password", "reset"], "responses": ["p"]},
+        "bug": {"patterns": ["not working"], "responses": ["b"]},
+        "hours": {"patterns": ["working hours"], "responses": ["h"]},
+    },
+    "fallback_responses": ["f"],
+    "help_text": "h",
+}
+INDEX = {
+    "shipping": {"shipping": 1}, "order": {"shipping": 1},
+    "password": {"password": 1}, "reset": {"password": 1},
+    "working": {"bug": 1, "hours": 1}, "hour": {"hours": 1},
+}
+
+
+def compiled(phrases=()):
+    return ce.CompiledKB(SOURCE, "test", index=INDEX, phrases=list(phrases))
+
+
+# ── Aho-Corasick phrase matcher ──
+def test_phrase_matcher_finds_overlapping_and_nested_phrases():
+    matcher = ce.PhraseMatcher([("not", "working"), ("working", "hour"),
+                                ("is", "not"), ("hour",)])
+    assert matcher.find("it is not working hour".split()) == {0, 1, 2, 3}
+    assert matcher.find("working not".split()) == set()
+
+
+def test_phrase_matcher_follows_failure_links():
+    matcher = ce.PhraseMatcher([("a", "b", "c"), ("b", "d")])
+    # "a b" fails on "d" and must fall back to the "b" state
+    assert matcher.find("a b d".split()) == {1}
+    assert matcher.find("a b c".split()) == {0}
+
+
+def test_phrase_bonuses_skip_stopwords_and_question_frames():
+    postings = {"not": {}, "working": {"bug": 1.0, "hours": 1.0},
+                "offer": {"features": 1.0}}
+    bonuses = ce.phrase_bonuses(
+        [(("not", "working"), "bug"), (("do", "you", "offer"), "features"),
+         (("what", "can"), "features")], postings)
+    assert bonuses == [ce.PHRASE_WEIGHT * 1.0, 0.0, 0.0]
+
+
+# ── SymSpell typo correction ──
+def test_edit_distance_counts_transpositions_once():
+    assert ce.edit_distance("pasword", "password", 2) == 1
+    assert ce.edit_distance("shpiping", "shipping", 2) == 1
+    assert ce.edit_distance("abc", "xyz", 2) == 3
+    assert ce.edit_distance("a", "abcdef", 2) == 3
+
+
+def test_deletes_reach_max_distance():
+    assert ce._deletes("abc", 1) == {"abc", "ab", "ac", "bc"}
+    assert "a" in ce._deletes("abc", 2)
+
+
+def test_correct_uses_the_deletion_index():
+    kb = compiled().prepare()
+    assert kb.correct("pasword") == "password"
+    assert kb.correct("shiping") == "shipping"
+    assert kb.correct("zzzzzzzz") is None
+
+
+def test_correct_gives_up_past_the_deadline():
+    kb = compiled().prepare()
+    assert kb.correct("pasword", deadline=0.0) is None
+    # Not cached, so a later call with time left still corrects
+    assert kb.correct("pasword") == "password"
+
+
+def test_correct_caps_candidates(monkeypatch):
+    source = {"intents": {f"i{i}": {"patterns": [f"item{i:04d}"],
+                                    "responses": ["x"]} for i in range(2000)},
+              "fallback_responses": ["f"], "help_text": "h"}
+    index = {f"item{i:04d}": {f"i{i}": 1} for i in range(2000)}
+    kb = ce.CompiledKB(source, "skus", index=index, phrases=[]).prepare()
+    calls = []
+    real = ce.edit_distance
+
+    def counting(a, b, max_distance):
+        calls.append(b)
+        return real(a, b, max_distance)
+
+    monkeypatch.setattr(ce, "edit_distance", counting)
+    assert kb.correct("itemm123") is not None
+    assert len(calls) <= ce.FUZZY_MAX_CANDIDATES
+
+
+def test_rank_intents_adds_phrase_bonus():
+    kb = compiled([(("not", "working"), "bug"), (("working", "hour"), "hours")])
+    phrase_hits = kb.phrase_matcher.find(["not", "working"])
+    ranked = ce.rank_intents(["working"], 2, kb, "overlap", phrase_hits)
+    assert ranked[0][0] == "bug"
+    assert ranked[0][1] > ranked[1][1]
+
+
+@pytest.mark.skipif(bool(ce.missing_nltk_data()), reason="NLTK data not installed")
+def test_routing_cases():
+    assert ce.check_routing() == []
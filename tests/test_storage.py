@@ -0,0 +1,142 @@
+import csv
+import os
+
+import storage
+
+
+def log_turns(store, n, session="s1", intent="refund"):
+    for i in range(n):
+        store.log(session, "user", f"question {i}", intent, "high")
+        store.log(session, "bot", f"answer {i}", intent, "high")
+    store.flush()
+
+
+def test_fetch_pages_newest_first(store):
+    log_turns(store, 10)
+    first = store.fetch(None, 6)
+    second = store.fetch(first[-1]["id"], 6)
+    ids = [r["id"] for r in first + second]
+    assert ids == sorted(ids, reverse=True)
+    assert len(set(ids)) == 12
+    assert first[0]["message"] == "answer 9"
+
+
+def test_fetch_filters(store):
+    log_turns(store, 3, session="a", intent="refund")
+    log_turns(store, 2, session="b", intent="shipping")
+    rows = store.fetch(None, 100, session_id="b", role="user")
+    assert [r["message"] for r in rows] == ["question 1", "question 0"]
+    assert all(r["intent"] == "shipping" for r in rows)
+    assert store.fetch(None, 100, intent="pricing") == []
+
+
+def test_stats_and_intent_stats(store):
+    log_turns(store, 3, session="a", intent="refund")
+    log_turns(store, 1, session="b", intent="shipping")
+    assert store.stats() == {"total_messages": 8, "total_sessions": 2,
+                             "user_messages": 4, "bot_messages": 4}
+    assert {r["intent"]: r["count"] for r in store.intent_stats()} == {
+        "refund": 3, "shipping": 1}
+
+
+def test_clear_resets_everything(store):
+    log_turns(store, 5)
+    generation = store.generation()
+    store.clear()
+    assert store.stats()["total_messages"] == 0
+    assert store.intent_stats() == []
+    assert store.fetch(None, 10) == []
+    assert store.generation() != generation
+    log_turns(store, 1)
+    assert store.stats()["total_messages"] == 2
+
+
+def test_export_caps_and_orders(store, tmp_path):
+    log_turns(store, 20)
+    path = str(tmp_path / "out.csv")
+    assert store.export(path, max_rows=5, chunk_size=3) == 5
+    with open(path, newline="", encoding="utf-8") as fh:
+        oldest = list(csv.DictReader(fh))
+    assert [r["message"] for r in oldest][:2] == ["question 0", "answer 0"]
+
+    assert store.export(path, max_rows=5, chunk_size=3, newest_first=True) == 5
+    with open(path, newline="", encoding="utf-8") as fh:
+        newest = list(csv.DictReader(fh))
+    assert [r["message"] for r in newest][:2] == ["answer 19", "question 19"]
+
+
+def test_create_backend_rejects_unknown_names():
+    try:
+        storage.create_backend("nope")
+    except ValueError as e:
+        assert "nope" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
+
+
+# ── segment log ──
+def test_segments_seal_and_reopen(tmp_path):
+    directory = str(tmp_path / "segments")
+    store = storage.SegmentLogBackend(directory, max_bytes=2000)
+    store.open()
+    log_turns(store, 30)
+    store.close()
+    assert len([p for p in os.listdir(directory) if p.endswith(".json")]) > 1
+
+    reopened = storage.SegmentLogBackend(directory, max_bytes=2000)
+    reopened.open()
+    try:
+        assert reopened.stats()["total_messages"] == 60
+        rows = reopened.fetch(None, 100)
+        assert [r["id"] for r in rows] == list(range(60, 0, -1))
+        reopened.log("s1", "user", "after reopen")
+        assert reopened.fetch(None, 1)[0]["id"] == 61
+    finally:
+        reopened.close()
+
+
+def test_segments_recover_torn_write_and_stale_index(tmp_path):
+    directory = str(tmp_path / "segments")
+    store = storage.SegmentLogBackend(directory)
+    store.open()
+    log_turns(store, 5)
+    store.close()
+
+    data = os.path.join(directory, "segment-000000000001.jsonl")
+    index = os.path.join(directory, "segment-000000000001.idx")
+    # A crash mid-append: half a record in the data file, and the index
+    # missing the last two offsets
+    with open(data, "ab") as fh:
+        fh.write(b'{"id": 11, "timestamp": "2024-')
+    with open(index, "r+b") as fh:
+        fh.truncate(os.path.getsize(index) - 16)
+
+    reopened = storage.SegmentLogBackend(directory)
+    reopened.open()
+    try:
+        assert reopened.stats()["total_messages"] == 10
+        assert reopened.fetch(None, 1)[0]["message"] == "answer 4"
+        reopened.log("s1", "user", "next")
+        rows = reopened.fetch(None, 2)
+        assert [(r["id"], r["message"]) for r in rows] == [
+            (11, "next"), (10, "answer 4")]
+    finally:
+        reopened.close()
+
+
+def test_segments_rebuild_missing_summary(tmp_path):
+    directory = str(tmp_path / "segments")
+    store = storage.SegmentLogBackend(directory, max_bytes=1000)
+    store.open()
+    log_turns(store, 20)
+    store.close()
+    summaries = sorted(p for p in os.listdir(directory) if p.endswith(".json"))
+    os.remove(os.path.join(directory, summaries[0]))
+
+    reopened = storage.SegmentLogBackend(directory, max_bytes=1000)
+    reopened.open()
+    try:
+        assert reopened.stats()["total_messages"] == 40
+        assert reopened.intent_stats() == [{"intent": "refund", "count": 20}]
+    finally:
+        reopened.close()
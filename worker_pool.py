@@ -0,0 +1,111 @@
+"""
+Multi-core classification with a pool of worker processes.
+
+    with ClassifierPool(processes=16) as pool:
+        replies = pool.get_responses(messages)
+
+Each worker loads the NLTK data and compiles the knowledge base once, in
+its initializer. Workers only classify (intent + confidence); responses
+are picked in the calling process with chatbot_engine.respond(), so
+for the same random seed the output is identical to get_responses().
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import chatbot_engine
+
+# Messages per task sent to a worker; large enough to amortize pickling
+CHUNK_SIZE = 256
+
+
+def _init_worker():
+    chatbot_engine.get_engine().warm_up()
+
+
+def _ping(hold: float) -> int:
+    time.sleep(hold)
+    return os.getpid()
+
+
+class ClassifierPool:
+    """
+    Process pool for classify()/classify_batch(). At most `max_pending`
+    tasks are in flight; submitting more blocks the caller until a
+    worker frees a slot, so a huge batch never queues all of its chunks
+    (and their pickled messages) at once. classify_async() has its own
+    `max_pending` slots, awaited on the event loop instead of blocking it.
+    """
+
+    def __init__(self, processes: int | None = None,
+                 chunk_size: int = CHUNK_SIZE, max_pending: int | None = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.max_pending = max_pending or self.processes * 2
+        # spawn, not fork: the parent may hold threads (LogWriter, DB pool)
+        self._executor = ProcessPoolExecutor(
+            self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._async_slots = asyncio.Semaphore(self.max_pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def warm(self) -> set[int]:
+        """Start every worker and wait for its initializer; returns PIDs."""
+        # Each ping holds its worker briefly so the pool has to spawn all
+        # of them instead of reusing the first idle one.
+        futures = [self._executor.submit(_ping, 0.2)
+                   for _ in range(self.processes)]
+        return {f.result() for f in futures}
+
+    def _submit(self, fn, *args) -> Future:
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def classify(self, message: str) -> dict:
+        return self._submit(chatbot_engine.classify, message).result()
+
+    async def classify_async(self, message: str) -> dict:
+        """classify() for event loops; waits for a slot without blocking
+        the loop."""
+        async with self._async_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, chatbot_engine.classify, message)
+
+    def classify_many(self, messages: list[str]) -> list[dict]:
+        """classify_batch() spread over the workers in chunk_size tasks."""
+        futures = [
+            self._submit(chatbot_engine.classify_batch,
+                         messages[i:i + self.chunk_size])
+            for i in range(0, len(messages), self.chunk_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def get_response(self, message: str) -> dict:
+        return chatbot_engine.respond(self.classify(message))
+
+    def get_responses(self, messages: list[str]) -> list[dict]:
+        return [chatbot_engine.respond(r) for r in self.classify_many(messages)]
+
+    def close(self):
+        self._executor.shutdown()